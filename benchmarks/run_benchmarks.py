@@ -0,0 +1,249 @@
+"""
+Benchmarks for ECHO hot paths: guide-rule retrieval, song snapshot building
+and the drafts store.
+
+    python benchmarks/run_benchmarks.py                      # full run
+    python benchmarks/run_benchmarks.py --quick --only rules
+    python benchmarks/run_benchmarks.py --save-baseline benchmarks/baseline.json
+    python benchmarks/run_benchmarks.py --compare benchmarks/baseline.json
+
+Each case reports throughput (ops/s), mean time per op and, for one extra op
+run under tracemalloc, the peak traced memory and the number of memory blocks
+it left allocated. --compare exits with status 1 if any case got slower than
+the baseline by more than --tolerance.
+
+Rule packs, compiled-rule caches and drafts all go to a temp dir, so the real
+data/ folder is never touched. The drafts cases run against every drafts backend.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Any, Callable, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_TMP = tempfile.mkdtemp(prefix="echo_bench_")
+# must be set before src.config.settings is imported
+os.environ["ECHO_RULE_PACKS_DIR"] = os.path.join(_TMP, "rule_packs")
+os.environ["ECHO_RULE_CACHE_DIR"] = os.path.join(_TMP, "rule_cache")
+
+from src.agents import knowledge_base as kb  # noqa: E402
+from src.models.song import Song  # noqa: E402
+from src.storage import drafts_store  # noqa: E402
+from src.utils.context_builder import build_song_snapshot  # noqa: E402
+
+RULE_SIZES = (10, 100, 1_000, 10_000)
+LINE_SIZES = (10, 100, 1_000, 5_000)
+DRAFT_SIZES = (10, 100, 1_000, 10_000, 50_000)
+QUICK_LIMITS = {"rules": 1_000, "snapshot": 1_000, "drafts": 1_000}
+
+
+# ---------- synthetic data ----------
+def _vocab(rng: random.Random, n: int = 3_000) -> List[str]:
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    return ["".join(rng.choice(letters) for _ in range(rng.randint(3, 9))) for _ in range(n)]
+
+
+def synthetic_rules(n: int, seed: int = 0) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    vocab = _vocab(rng)
+    rules = []
+    for _ in range(n):
+        keywords = rng.sample(vocab, rng.randint(1, 4))
+        if rng.random() < 0.3:
+            keywords.append(" ".join(rng.sample(vocab, 2)))  # phrase keyword
+        rules.append({"keywords": keywords, "rule": " ".join(rng.choices(vocab, k=rng.randint(8, 14)))})
+    return rules
+
+
+def synthetic_messages(n: int, seed: int = 1) -> List[str]:
+    rng = random.Random(seed)
+    vocab = _vocab(random.Random(0))  # same vocabulary as the rules
+    return [" ".join(rng.choices(vocab, k=rng.randint(20, 60))) for _ in range(n)]
+
+
+def synthetic_song(lines: int, seed: int = 2) -> Song:
+    rng = random.Random(seed)
+    vocab = _vocab(rng, 500)
+    song = Song(title="Benchmark Song", intent="a song to time things with")
+    song.lyrics = [" ".join(rng.choices(vocab, k=rng.randint(4, 9))) for _ in range(lines)]
+    song.melody_description = "mid-tempo, warm pads, lifting chorus"
+    song.genre, song.sub_genre = "Pop", "Synth-pop"
+    return song
+
+
+def synthetic_drafts(n: int) -> List[Dict[str, Any]]:
+    song = drafts_store.song_to_dict(synthetic_song(4))
+    return [
+        {"id": f"draft-{i:06d}", "name": f"Draft {i + 1}", "updated_at": "2024-01-01T00:00:00Z", "song": song}
+        for i in range(n)
+    ]
+
+
+# ---------- measurement ----------
+def measure(fn: Callable[[], Any], min_time: float, max_reps: int = 100_000) -> Dict[str, float]:
+    fn()  # warm-up (lazy indexes, file cache)
+
+    times: List[float] = []
+    start = time.perf_counter()
+    while len(times) < 3 or (time.perf_counter() - start < min_time and len(times) < max_reps):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    fn()
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    blocks = sum(s.count_diff for s in after.compare_to(before, "filename") if s.count_diff > 0)
+
+    median = statistics.median(times)
+    return {
+        "ops_per_s": round(1.0 / median, 2) if median else float("inf"),
+        "mean_ms": round(statistics.fmean(times) * 1000, 4),
+        "reps": len(times),
+        "peak_kib": round(peak / 1024, 1),
+        "alloc_blocks": blocks,
+    }
+
+
+# ---------- cases ----------
+def bench_rules(sizes, min_time: float) -> Dict[str, Dict[str, float]]:
+    results = {}
+    messages = synthetic_messages(64)
+    memo = kb._retrieve_memo
+    for n in sizes:
+        kb._COMPILED["BENCH"] = kb.compile_rules(synthetic_rules(n))
+        for mode in ("keyword", "bm25", "semantic"):
+            kb._retrieve_memo = kb._Memo(0)  # ranking cost, not memo hits
+            it = itertools.count()
+            results[f"retrieve_rules[{mode}, {n} rules]"] = measure(
+                lambda: kb.retrieve_rules(messages[next(it) % len(messages)], "BENCH", mode=mode), min_time
+            )
+        kb._retrieve_memo = kb._Memo(len(messages))
+        results[f"retrieve_rules[memo hit, {n} rules]"] = measure(
+            lambda: kb.retrieve_rules(messages[0], "BENCH"), min_time
+        )
+    kb._retrieve_memo = memo
+    kb._COMPILED.pop("BENCH", None)
+    return results
+
+
+def bench_snapshot(sizes, min_time: float) -> Dict[str, Dict[str, float]]:
+    results = {}
+    for n in sizes:
+        song = synthetic_song(n)
+        results[f"build_song_snapshot[{n} lines]"] = measure(lambda: build_song_snapshot(song), min_time)
+    return results
+
+
+def bench_drafts(sizes, min_time: float) -> Dict[str, Dict[str, float]]:
+    results = {}
+    song = synthetic_song(12)
+
+    for backend in ("json", "sqlite", "journal"):
+        drafts_store.DRAFTS_BACKEND = backend
+        for n in sizes:
+            # fresh dir per case; sqlite/journal import drafts.json on first use (not timed)
+            data_dir = os.path.join(_TMP, f"data_{backend}_{n}")
+            os.makedirs(data_dir, exist_ok=True)
+            drafts_store.DATA_DIR = data_dir
+            drafts_store.DRAFTS_PATH = os.path.join(data_dir, "drafts.json")
+            drafts_store.DRAFTS_DB_PATH = os.path.join(data_dir, "drafts.db")
+            drafts_store.DRAFTS_JOURNAL_PATH = os.path.join(data_dir, "drafts.journal")
+            drafts_store.DRAFTS_HISTORY_PATH = os.path.join(data_dir, "draft_history.db")
+            with open(drafts_store.DRAFTS_PATH, "w", encoding="utf-8") as f:
+                json.dump(synthetic_drafts(n), f, ensure_ascii=False, indent=2)
+            drafts_store.get_backend()
+
+            middle_id = f"draft-{n // 2:06d}"
+            results[f"load_drafts[{backend}, {n} drafts]"] = measure(
+                drafts_store.load_drafts, min_time, max_reps=1_000
+            )
+            results[f"save_draft[{backend}, update, {n} drafts]"] = measure(
+                lambda: drafts_store.save_draft(song, draft_id=middle_id), min_time, max_reps=1_000
+            )
+    return results
+
+
+SUITES = {"rules": (bench_rules, RULE_SIZES), "snapshot": (bench_snapshot, LINE_SIZES), "drafts": (bench_drafts, DRAFT_SIZES)}
+
+
+# ---------- baseline ----------
+def compare(results: Dict[str, Dict[str, float]], baseline_path: str, tolerance: float) -> int:
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f).get("results", {})
+
+    regressions = 0
+    print(f"\nvs baseline {baseline_path} (tolerance {tolerance:.0%}):")
+    for name, cur in results.items():
+        base = baseline.get(name)
+        if not base or not base.get("ops_per_s"):
+            continue
+        ratio = cur["ops_per_s"] / base["ops_per_s"]
+        flag = ""
+        if ratio < 1 - tolerance:
+            flag = "  <-- REGRESSION"
+            regressions += 1
+        print(f"  {name:<48} {ratio:6.2f}x{flag}")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="ECHO hot-path benchmarks")
+    parser.add_argument("--only", choices=sorted(SUITES), action="append", help="run only these suites")
+    parser.add_argument("--quick", action="store_true", help="skip the largest sizes")
+    parser.add_argument("--min-time", type=float, default=0.5, help="seconds per case (default 0.5)")
+    parser.add_argument("--save-baseline", metavar="PATH", help="write results as a baseline JSON")
+    parser.add_argument("--compare", metavar="PATH", help="compare against a baseline JSON")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown vs baseline (default 0.25)")
+    args = parser.parse_args()
+
+    results: Dict[str, Dict[str, float]] = {}
+    try:
+        for suite in args.only or list(SUITES):
+            fn, sizes = SUITES[suite]
+            if args.quick:
+                sizes = [s for s in sizes if s <= QUICK_LIMITS[suite]]
+            for name, res in fn(sizes, args.min_time).items():
+                results[name] = res
+                print(f"{name:<48} {res['ops_per_s']:>12,.1f} ops/s {res['mean_ms']:>10.3f} ms"
+                      f" {res['peak_kib']:>10,.1f} KiB peak {res['alloc_blocks']:>8} blocks")
+    finally:
+        shutil.rmtree(_TMP, ignore_errors=True)
+
+    if args.save_baseline:
+        payload = {
+            "meta": {
+                "created": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "quick": args.quick,
+            },
+            "results": results,
+        }
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(payload, f, indent=2)
+        print(f"\nbaseline saved to {args.save_baseline}")
+
+    if args.compare:
+        return 1 if compare(results, args.compare, args.tolerance) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
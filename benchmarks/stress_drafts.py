@@ -0,0 +1,141 @@
+"""
+Concurrency stress test for the drafts store.
+
+    python benchmarks/stress_drafts.py                       # 32 writer processes, json backend
+    python benchmarks/stress_drafts.py --writers 48 --saves 20 --backend sqlite
+
+Each writer process saves its own new drafts, re-saves one draft shared by
+every writer, and deletes one of its drafts; reader processes keep loading
+the drafts while this happens. Afterwards every surviving draft must be
+there exactly once. Exits with status 1 on lost drafts, duplicates or a read
+that saw a broken file. Readers bypass the in-process drafts cache (and, for
+the json backend, also parse drafts.json directly) so reads really race the
+atomic file replace. Runs in a temp dir.
+"""
+
+import argparse
+import json
+import multiprocessing as mp
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SHARED_ID = "shared-draft"
+
+
+def _use_store(data_dir: str, backend: str):
+    from src.storage import drafts_store
+    drafts_store.DATA_DIR = data_dir
+    drafts_store.DRAFTS_PATH = os.path.join(data_dir, "drafts.json")
+    drafts_store.DRAFTS_DB_PATH = os.path.join(data_dir, "drafts.db")
+    drafts_store.DRAFTS_JOURNAL_PATH = os.path.join(data_dir, "drafts.journal")
+    drafts_store.DRAFTS_HISTORY_PATH = os.path.join(data_dir, "draft_history.db")
+    drafts_store.DRAFTS_BACKEND = backend
+    return drafts_store
+
+
+def _writer(data_dir: str, backend: str, writer: int, saves: int, start, errors) -> None:
+    from src.models.song import Song
+    store = _use_store(data_dir, backend)
+    start.wait()
+    try:
+        for i in range(saves):
+            song = Song(title=f"w{writer} s{i}")
+            song.lyrics = [f"line {n} from writer {writer}" for n in range(8)]
+            store.save_draft(song, draft_id=f"w{writer}-{i}")
+            if i % 5 == 0:
+                store.save_draft(Song(title=f"shared by w{writer}"), draft_id=SHARED_ID)
+        store.delete_draft(f"w{writer}-0")
+    except Exception as e:
+        errors.put(f"writer {writer}: {type(e).__name__}: {e}")
+
+
+def _reader(data_dir: str, backend: str, stop, start, errors, reads) -> None:
+    store = _use_store(data_dir, backend)
+    store.DRAFTS_CACHE_CHECK_SECONDS = 0  # re-check the file on every load instead of serving the cache
+    start.wait()
+    n = 0
+    while not stop.is_set():
+        try:
+            store.load_drafts()
+            if backend == "json":
+                # straight from disk too: a read must never see a file mid-replace
+                with open(store.DRAFTS_PATH, "r", encoding="utf-8") as f:
+                    if not isinstance(json.load(f), list):
+                        raise ValueError("drafts.json is not a list")
+            n += 1
+        except Exception as e:
+            errors.put(f"reader: {type(e).__name__}: {e}")
+    reads.put(n)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Concurrent save/delete stress test for the drafts store")
+    parser.add_argument("--writers", type=int, default=32)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--saves", type=int, default=15, help="new drafts per writer")
+    parser.add_argument("--backend", choices=("json", "sqlite", "journal"), default="json")
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix="echo_stress_")
+    ctx = mp.get_context("spawn")
+    start, stop = ctx.Event(), ctx.Event()
+    errors, reads = ctx.Queue(), ctx.Queue()
+    try:
+        writers = [
+            ctx.Process(target=_writer, args=(data_dir, args.backend, w, args.saves, start, errors))
+            for w in range(args.writers)
+        ]
+        readers = [
+            ctx.Process(target=_reader, args=(data_dir, args.backend, stop, start, errors, reads))
+            for _ in range(args.readers)
+        ]
+        for p in writers + readers:
+            p.start()
+
+        t0 = time.perf_counter()
+        start.set()
+        for p in writers:
+            p.join()
+        elapsed = time.perf_counter() - t0
+        stop.set()
+        for p in readers:
+            p.join()
+
+        store = _use_store(data_dir, args.backend)
+        drafts = store.load_drafts()
+        ids = [d["id"] for d in drafts]
+        expected = {f"w{w}-{i}" for w in range(args.writers) for i in range(1, args.saves)} | {SHARED_ID}
+
+        problems = []
+        while not errors.empty():
+            problems.append(errors.get())
+        missing = expected - set(ids)
+        if missing:
+            problems.append(f"{len(missing)} drafts lost, e.g. {sorted(missing)[:5]}")
+        if len(ids) != len(set(ids)):
+            problems.append(f"{len(ids) - len(set(ids))} duplicate drafts")
+        extra = set(ids) - expected
+        if extra:
+            problems.append(f"{len(extra)} deleted drafts came back, e.g. {sorted(extra)[:5]}")
+
+        total_reads = sum(reads.get() for _ in readers)
+        writes = args.writers * (args.saves + (args.saves + 4) // 5 + 1)
+        print(f"{args.backend}: {args.writers} writers, {writes} writes in {elapsed:.2f}s "
+              f"({writes / elapsed:.0f} writes/s), {total_reads} concurrent reads, {len(ids)} drafts at the end")
+        for p in problems:
+            print("FAIL:", p)
+        if not problems:
+            print("OK: no lost, duplicated or resurrected drafts; no broken reads")
+        return 1 if problems else 0
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
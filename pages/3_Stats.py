@@ -0,0 +1,63 @@
+import streamlit as st
+from dotenv import load_dotenv
+
+from src.agents.base_agent import BaseAgent
+from src.agents.knowledge_base import rule_memo_stats
+from src.agents.metrics import get_metrics
+from src.agents.response_cache import get_response_cache
+from src.storage.autosave import get_autosaver
+from src.storage.drafts_store import get_backend, get_search_index, get_history
+from src.ui.views import inject_global_css
+
+load_dotenv()
+
+st.set_page_config(
+    page_title="ECHO - Stats",
+    page_icon="🎵",
+    layout="wide",
+    initial_sidebar_state="collapsed"
+)
+
+inject_global_css()
+
+# LLM call stats for this server process (all sessions)
+metrics = get_metrics()
+
+st.title("LLM CALL STATS")
+
+st.subheader("Latency by agent / call kind (seconds)")
+rows = metrics.summary()
+if rows:
+    st.dataframe(rows, use_container_width=True)
+else:
+    st.info("No agent calls yet in this process.")
+
+c1, c2 = st.columns(2)
+with c1:
+    st.subheader("Response cache")
+    st.json(get_response_cache().stats())
+with c2:
+    st.subheader("Single-flight")
+    st.json(BaseAgent._flights.stats())
+
+c3, c4 = st.columns(2)
+with c3:
+    st.subheader("Guide-rule retrieval memo")
+    st.json(rule_memo_stats())
+with c4:
+    st.subheader("Drafts store")
+    st.json(get_backend().stats())
+    st.subheader("Drafts search index")
+    st.json(get_search_index().stats())
+    st.subheader("Draft history")
+    st.json(get_history().stats())
+    st.subheader("Autosave")
+    st.json(get_autosaver().stats())
+
+st.subheader("Recent calls")
+st.dataframe(metrics.recent_calls(), use_container_width=True)
+
+st.subheader("Prometheus export")
+prom_text = metrics.render_prometheus()
+st.download_button("Download metrics.txt", prom_text, file_name="metrics.txt", mime="text/plain")
+st.code(prom_text, language="text")
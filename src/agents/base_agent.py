@@ -3,26 +3,109 @@ Base AI agent for ECHO application.
 Handles Gemini API integration (Fixed Logic).
 """
 
-import os
-from google import genai
-from typing import List, Dict, Optional
+import asyncio
+import threading
+import time
+from typing import List, Dict, Optional, Iterator
+
+from src.agents.llm_backends import LLMBackend
+from src.agents.metrics import CallRecord, get_metrics
+from src.agents.registry import get_shared_backend
+from src.agents.resilience import get_caller, CircuitOpenError, RateLimitTimeout
+from src.agents.response_cache import get_response_cache, make_cache_key
+from src.agents.single_flight import FlightTimeout, SingleFlight
+from src.config.settings import (
+    GEMINI_MODEL, GEMINI_MAX_CONCURRENT_REQUESTS, GEMINI_FALLBACK_MESSAGE, LLM_CACHE_ENABLED,
+    SINGLE_FLIGHT_WAIT_SECONDS,
+)
 
 
 class BaseAgent:
     """Base class for AI agents using Gemini (google-genai)."""
 
-    def __init__(self, system_prompt: str):
-        self.api_key = os.getenv("GEMINI_API_KEY")
-        if not self.api_key:
-            raise ValueError("GEMINI_API_KEY not found in environment variables")
+    # caps in-flight Gemini calls for the whole process (all agents, all sessions),
+    # which also bounds how many pooled connections the shared client opens
+    _request_slots = threading.BoundedSemaphore(GEMINI_MAX_CONCURRENT_REQUESTS)
+
+    # identical prompts already in flight (double-click, many users) share one call
+    _flights = SingleFlight(wait_timeout=SINGLE_FLIGHT_WAIT_SECONDS)
 
-        # google-genai client
-        self.client = genai.Client(api_key=self.api_key)
+    def __init__(self, system_prompt: str, backend: Optional[LLMBackend] = None):
+        # Gemini or the fake load-test backend (shared by default, see src/agents/registry.py)
+        self.backend = backend or get_shared_backend()
 
         # keep these so you can reuse in requests
-        self.model_name = "gemini-2.0-flash"
+        self.model_name = GEMINI_MODEL
         self.system_prompt = system_prompt
 
+        # identical prompts are answered from cache (shared by all agents)
+        self.cache = get_response_cache() if LLM_CACHE_ENABLED else None
+
+        # rate limit / retry / circuit breaker, shared by everyone using this API key
+        self.resilience = get_caller(self.backend.rate_limit_key)
+
+    def _build_contents(
+            self,
+            user_message: str,
+            song_snapshot,
+            chat_history: Optional[List[Dict]] = None
+    ) -> List[Dict]:
+        """
+        Build the Gemini `contents` list for one turn.
+        Avoids sending duplicate user messages in the history.
+        """
+        contents = []
+
+        # 1) Song snapshot as constant context (send as USER context)
+        if song_snapshot:
+            contents.append({
+                "role": "user",
+                "parts": [{"text": f"SONG SNAPSHOT (context):\n{str(song_snapshot)}"}],
+            })
+
+        # 2) Chat history (avoid duplicating the current user message)
+        if chat_history:
+            history_to_process = chat_history
+            if (
+                    chat_history
+                    and chat_history[-1].get("content") == user_message
+                    and chat_history[-1].get("role") == "user"
+            ):
+                history_to_process = chat_history[:-1]
+
+            for msg in history_to_process:
+                role = "model" if msg.get("role") == "assistant" else "user"
+                contents.append({
+                    "role": role,
+                    "parts": [{"text": msg.get("content", "")}],
+                })
+
+        # 3) Current message (this already includes your short-rules + title/topic/mood prefix)
+        contents.append({
+            "role": "user",
+            "parts": [{"text": user_message}],
+        })
+
+        return contents
+
+    def _build_config(self) -> Dict:
+        # LIMIT OUTPUT!
+        return {
+            "system_instruction": self.system_prompt,
+            "max_output_tokens": 160,  # ✅ הכי חשוב כדי לעצור פסקאות
+            "temperature": 0.6,  # ✅ פחות נטייה להאריך
+        }
+
+    def _cache_key(self, contents: List[Dict], config: Dict) -> str:
+        return make_cache_key(self.model_name, self.system_prompt, contents, config)
+
+    def _cache_get(self, key: str) -> Optional[str]:
+        return self.cache.get(key) if self.cache is not None else None
+
+    def _cache_set(self, key: str, text: str) -> None:
+        if self.cache is not None and text:
+            self.cache.set(key, text)
+
     def get_response(
             self,
             user_message: str,
@@ -33,53 +116,270 @@ class BaseAgent:
         Get a response from the AI agent.
         Avoids sending duplicate user messages in the history.
         """
+        return self.generate(self._build_contents(user_message, song_snapshot, chat_history))
+
+    async def get_response_async(
+            self,
+            user_message: str,
+            song_snapshot,
+            chat_history: Optional[List[Dict]] = None
+    ) -> str:
+        """
+        Async version of get_response (uses the backend's async call).
+        Lets several agents be queried concurrently, see src/agents/multi_agent.py.
+        """
+        return await self.generate_async(self._build_contents(user_message, song_snapshot, chat_history))
+
+    def stream_response(
+            self,
+            user_message: str,
+            song_snapshot,
+            chat_history: Optional[List[Dict]] = None
+    ) -> Iterator[str]:
+        """
+        Stream a response from the AI agent, yielding text chunks as they arrive.
+        Same prompt as get_response; errors are yielded as a final chunk.
+        """
+        return self.generate_stream(self._build_contents(user_message, song_snapshot, chat_history))
+
+    # ---------- calls with ready-made contents (see src/utils/prompt_builder.py) ----------
+    def _new_record(self, kind: str) -> CallRecord:
+        return CallRecord(agent=type(self).__name__, kind=kind, backend=self.backend.name)
+
+    @staticmethod
+    def _apply_usage(rec: CallRecord, usage: Dict) -> None:
+        rec.input_tokens = usage.get("input_tokens")
+        rec.output_tokens = usage.get("output_tokens")
+
+    def _call_once(self, contents: List[Dict], config: Dict, usage: Dict) -> str:
+        with self._request_slots:
+            return self.backend.generate(self.model_name, contents, config, usage=usage)
+
+    def generate(self, contents: List[Dict]) -> str:
+        rec = self._new_record("sync")
+        start = time.perf_counter()
         try:
-            contents = []
+            config = self._build_config()
 
-            # 1) Song snapshot as constant context (send as USER context)
-            if song_snapshot:
-                contents.append({
-                    "role": "user",
-                    "parts": [{"text": f"SONG SNAPSHOT (context):\n{str(song_snapshot)}"}],
-                })
+            key = self._cache_key(contents, config)
+            cached = self._cache_get(key)
+            if cached is not None:
+                rec.cache_hit = True
+                return cached
 
-            # 2) Chat history (avoid duplicating the current user message)
-            if chat_history:
-                history_to_process = chat_history
-                if (
-                        chat_history
-                        and chat_history[-1].get("content") == user_message
-                        and chat_history[-1].get("role") == "user"
-                ):
-                    history_to_process = chat_history[:-1]
-
-                for msg in history_to_process:
-                    role = "model" if msg.get("role") == "assistant" else "user"
-                    contents.append({
-                        "role": role,
-                        "parts": [{"text": msg.get("content", "")}],
-                    })
-
-            # 3) Current message (this already includes your short-rules + title/topic/mood prefix)
-            contents.append({
-                "role": "user",
-                "parts": [{"text": user_message}],
-            })
+            usage: Dict = {}
+
+            def on_retry():
+                rec.retries += 1
 
-            # 4) Call Gemini (LIMIT OUTPUT!)
-            resp = self.client.models.generate_content(
-                model=self.model_name,
-                contents=contents,
-                config={
-                    "system_instruction": self.system_prompt,
-                    "max_output_tokens": 160,  # ✅ הכי חשוב כדי לעצור פסקאות
-                    "temperature": 0.6,  # ✅ פחות נטייה להאריך
-                },
+            text, shared = self._flights.do(
+                key, lambda: self.resilience.call(lambda: self._call_once(contents, config, usage), on_retry)
             )
+            rec.shared = shared
+            self._apply_usage(rec, usage)
+            if not shared:
+                self._cache_set(key, text)
+            return text if text else "..."
+
+        except (CircuitOpenError, RateLimitTimeout) as e:
+            rec.error = type(e).__name__
+            print(f"Gemini unavailable: {e}")
+            return GEMINI_FALLBACK_MESSAGE
+        except Exception as e:
+            rec.error = type(e).__name__
+            print(f"Gemini API Error: {e}")
+            return "Error calling Gemini API."
+        finally:
+            rec.wall_s = time.perf_counter() - start
+            get_metrics().record(rec)
+
+    async def generate_async(self, contents: List[Dict]) -> str:
+        rec = self._new_record("async")
+        start = time.perf_counter()
+        try:
+            config = self._build_config()
+
+            key = self._cache_key(contents, config)
+            cached = self._cache_get(key)
+            if cached is not None:
+                rec.cache_hit = True
+                return cached
 
-            text = (resp.text or "").strip()
+            flight, leader = self._flights.begin(key)
+            if not leader:
+                try:
+                    text = await asyncio.to_thread(flight.wait, self._flights.wait_timeout)
+                    rec.shared = True
+                    return text if text else "..."
+                except FlightTimeout:
+                    self._flights.timed_out()  # the leader is stuck: make the call ourselves
+
+            try:
+                text = await self._call_with_retries_async(contents, config, rec)
+            except BaseException as e:
+                if leader:
+                    self._flights.finish(key, flight, error=e)
+                raise
+            if leader:
+                self._flights.finish(key, flight, result=text)
+
+            self._cache_set(key, text)
             return text if text else "..."
 
+        except (CircuitOpenError, RateLimitTimeout) as e:
+            rec.error = type(e).__name__
+            print(f"Gemini unavailable: {e}")
+            return GEMINI_FALLBACK_MESSAGE
+        except Exception as e:
+            rec.error = type(e).__name__
+            print(f"Gemini API Error: {e}")
+            return "Error calling Gemini API."
+        finally:
+            rec.wall_s = time.perf_counter() - start
+            get_metrics().record(rec)
+
+    async def _call_with_retries_async(self, contents: List[Dict], config: Dict, rec: CallRecord) -> str:
+        usage: Dict = {}
+        attempt = 0
+        while True:
+            trial = await self._before_call_async()
+            try:
+                await self._acquire_slot_async()
+            except BaseException:
+                self.resilience.abandon(trial)
+                raise
+            try:
+                text = await self.backend.generate_async(self.model_name, contents, config, usage=usage)
+            except Exception as e:
+                delay = self.resilience.retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                rec.retries += 1
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            except BaseException:
+                # cancelled mid-call: no verdict on the upstream, but free the half-open trial
+                self.resilience.abandon(trial)
+                raise
+            finally:
+                self._request_slots.release()
+            self.resilience.record_success()
+            self._apply_usage(rec, usage)
+            return text
+
+    async def _before_call_async(self) -> bool:
+        """resilience.before_call (a blocking rate-limit wait) in a thread, without leaking on cancel."""
+        task = asyncio.ensure_future(asyncio.to_thread(self.resilience.before_call))
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            # the thread still finishes; free the half-open trial if it got one
+            def release(t: asyncio.Future) -> None:
+                if not t.cancelled() and t.exception() is None:
+                    self.resilience.abandon(t.result())
+
+            task.add_done_callback(release)
+            raise
+
+    async def _acquire_slot_async(self) -> None:
+        """
+        Take a request slot, polling from the event loop: a thread blocked in
+        acquire() would still take the slot after the task was cancelled.
+        """
+        delay = 0.005
+        while not self._request_slots.acquire(blocking=False):
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.1)
+
+    def _stream_with_retries(self, contents: List[Dict], config: Dict, rec: CallRecord) -> Iterator[str]:
+        usage: Dict = {}
+        got_text = False
+        attempt = 0
+        while True:
+            trial = self.resilience.before_call()
+            try:
+                with self._request_slots:
+                    for text in self.backend.generate_stream(self.model_name, contents, config, usage=usage):
+                        got_text = True
+                        yield text
+            except Exception as e:
+                # once text reached the user we can't restart the answer
+                if got_text:
+                    self.resilience.record_failure(e)
+                    raise
+                delay = self.resilience.retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                rec.retries += 1
+                time.sleep(delay)
+                attempt += 1
+                continue
+            except BaseException:
+                # stream closed by the consumer (GeneratorExit on a rerun) or cancelled
+                self.resilience.abandon(trial)
+                raise
+            self.resilience.record_success()
+            self._apply_usage(rec, usage)
+            return
+
+    def generate_stream(self, contents: List[Dict]) -> Iterator[str]:
+        rec = self._new_record("stream")
+        start = time.perf_counter()
+        got_text = False
+        try:
+            config = self._build_config()
+
+            key = self._cache_key(contents, config)
+            cached = self._cache_get(key)
+            if cached is not None:
+                rec.cache_hit = True
+                rec.ttft_s = time.perf_counter() - start
+                yield cached
+                return
+
+            # same prompt already streaming for someone else -> wait and show the whole answer
+            flight, leader = self._flights.begin(key)
+            if not leader:
+                try:
+                    text = flight.wait(self._flights.wait_timeout)
+                    rec.shared = True
+                    rec.ttft_s = time.perf_counter() - start
+                    yield text if text else "..."
+                    return
+                except FlightTimeout:
+                    self._flights.timed_out()  # the leader is stuck: stream it ourselves
+
+            pieces = []
+            error: Optional[BaseException] = None
+            try:
+                for text in self._stream_with_retries(contents, config, rec):
+                    if not got_text:
+                        rec.ttft_s = time.perf_counter() - start
+                    got_text = True
+                    pieces.append(text)
+                    yield text
+            except BaseException as e:
+                # GeneratorExit / script stop (consumer left early) -> waiters get a plain error
+                error = e if isinstance(e, Exception) else RuntimeError("leader stream was abandoned")
+                raise
+            finally:
+                if leader:
+                    self._flights.finish(key, flight, result="".join(pieces).strip(), error=error)
+
+            if not got_text:
+                yield "..."
+            else:
+                self._cache_set(key, "".join(pieces).strip())
+
+        except (CircuitOpenError, RateLimitTimeout) as e:
+            rec.error = type(e).__name__
+            print(f"Gemini unavailable: {e}")
+            yield GEMINI_FALLBACK_MESSAGE
         except Exception as e:
+            rec.error = type(e).__name__
             print(f"Gemini API Error: {e}")
-            return "Error calling Gemini API."
\ No newline at end of file
+            yield "Error calling Gemini API." if not got_text else "\n(Error calling Gemini API.)"
+        finally:
+            rec.wall_s = time.perf_counter() - start
+            get_metrics().record(rec)
@@ -1,6 +1,21 @@
-from dataclasses import dataclass
-from typing import List, Dict, Any, Optional
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Optional, Tuple
+from collections import OrderedDict, defaultdict
+import hashlib
+import heapq
+import json
+import os
 import re
+import sys
+import threading
+
+from src.agents import phrase_matcher
+from src.agents.phrase_matcher import AhoCorasick
+from src.agents.rule_packs import RulePackLoader, load_compiled, save_compiled
+from src.config.settings import (
+    RULES_RANKING_MODE, RULE_PACKS_DIR, RULE_PACKS_POLL_SECONDS, RULE_CACHE_DIR,
+    RULE_EMBED_DIM, RULES_SEMANTIC_MIN_SCORE, RULES_HYBRID_SEMANTIC_WEIGHT, RULES_MEMO_MAX_ENTRIES,
+)
 
 
 # ---------- helpers ----------
@@ -12,10 +27,51 @@ def _tokenize(text: str) -> List[str]:
 def _normalize(text: str) -> str:
     return re.sub(r"\s+", " ", (text or "").lower()).strip()
 
-def _contains_phrase(norm_msg: str, phrase: str) -> bool:
-    # phrase match (space-normalized)
-    phrase = _normalize(phrase)
-    return phrase and phrase in norm_msg
+
+class _Memo:
+    """Small thread-safe LRU memo with hit/miss counters."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            value = self._data.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+                "size": len(self._data),
+            }
+
+
+def _memo_key(*parts: Any) -> str:
+    return hashlib.sha1("\x1f".join(str(p) for p in parts).encode("utf-8")).hexdigest()
 
 
 # ---------- rules ----------
@@ -82,43 +138,212 @@ DEFAULT_RULES = {
 }
 
 
-def retrieve_rules(message: str, state: str, limit: int = 3) -> List[Dict[str, Any]]:
+# ---------- compiled index ----------
+@dataclass
+class CompiledRules:
     """
-    Select relevant rules for the current state using keyword + phrase matching.
-    Returns list of rule dicts.
+    Rules of one state, pre-normalized once:
+    - keywords: single-word keyword -> rule ids (+2 on exact token, else +1 if it is a substring)
+    - phrases: phrase keyword -> rule ids (+3 when the phrase is in the message)
+    - matcher: Aho-Corasick automaton over all of them (one pass per message)
+    Rule ids repeat if a rule lists the same keyword twice (keeps the old scoring).
     """
-    state = (state or "").upper().strip()
-    rules = RULES_BY_STATE.get(state, [])
-    if not rules:
-        return []
+    rules: List[Dict[str, Any]]
+    keywords: Dict[str, List[int]] = field(default_factory=dict)
+    phrases: Dict[str, List[int]] = field(default_factory=dict)
+    matcher: Optional[AhoCorasick] = None
+    bm25: Any = None  # BM25RuleRanker, built on first use (needs numpy/scipy)
+    embeddings: Any = None  # RuleEmbeddingIndex, built on first use (needs numpy)
 
-    norm_msg = _normalize(message)
-    tokens = set(_tokenize(message))
 
-    scored = []
-    for rule in rules:
-        kws = rule.get("keywords", [])
-        score = 0
-
-        for kw in kws:
+def compile_rules(rules: List[Dict[str, Any]]) -> CompiledRules:
+    keywords = defaultdict(list)
+    phrases = defaultdict(list)
+    for rid, rule in enumerate(rules):
+        for kw in rule.get("keywords", []):
             kw_norm = _normalize(kw)
+            if not kw_norm:
+                continue
             if " " in kw_norm:
-                # phrase keyword
-                if _contains_phrase(norm_msg, kw_norm):
-                    score += 3
+                phrases[kw_norm].append(rid)
             else:
-                # token keyword
-                if kw_norm in tokens:
-                    score += 2
-                # light fallback: substring (for cases like "rhymes" vs "rhyme")
-                elif kw_norm and kw_norm in norm_msg:
-                    score += 1
+                keywords[kw_norm].append(rid)
+    return CompiledRules(
+        rules=list(rules),
+        keywords=dict(keywords),
+        phrases=dict(phrases),
+        matcher=AhoCorasick(list(keywords) + list(phrases)),
+    )
+
+
+def _compiled_to_data(compiled: Dict[str, CompiledRules]) -> Dict[str, Any]:
+    """JSON-safe form of the compiled index for the disk cache (bm25/embeddings are rebuilt lazily)."""
+    return {
+        state: {"rules": c.rules, "keywords": c.keywords, "phrases": c.phrases, "matcher": c.matcher.to_state()}
+        for state, c in compiled.items()
+    }
+
+
+def _compiled_from_data(data: Dict[str, Any]) -> Dict[str, CompiledRules]:
+    return {
+        state: CompiledRules(
+            rules=list(d["rules"]),
+            keywords={k: list(v) for k, v in d["keywords"].items()},
+            phrases={k: list(v) for k, v in d["phrases"].items()},
+            matcher=AhoCorasick.from_state(d["matcher"]),
+        )
+        for state, d in data.items()
+    }
+
+
+def _code_fingerprint() -> str:
+    """Hash of the modules that build the compiled index: editing them invalidates the disk cache."""
+    h = hashlib.sha256()
+    for module in (sys.modules[__name__], phrase_matcher):
+        try:
+            with open(module.__file__, "rb") as f:
+                h.update(f.read())
+        except (OSError, TypeError):
+            h.update(os.urandom(16))  # can't tell what built the cache -> never reuse it
+    return h.hexdigest()
+
+
+_CODE_FINGERPRINT = _code_fingerprint()
+
+_pack_loader = RulePackLoader(RULE_PACKS_DIR, poll_seconds=RULE_PACKS_POLL_SECONDS)
+_compile_lock = threading.Lock()
+
+
+def _merged_rules() -> Dict[str, List[Dict[str, Any]]]:
+    """Built-in RULES_BY_STATE + rules from the external packs (packs appended per state)."""
+    merged = {state: list(rules) for state, rules in RULES_BY_STATE.items()}
+    for state, rules in _pack_loader.rules_by_state().items():
+        merged.setdefault(state, []).extend(rules)
+    return merged
+
+
+def _compiled_cache_key() -> str:
+    h = hashlib.sha256(_CODE_FINGERPRINT.encode("ascii"))
+    h.update(json.dumps(RULES_BY_STATE, sort_keys=True).encode("utf-8"))
+    h.update(_pack_loader.content_hash().encode("ascii"))
+    return h.hexdigest()
+
+
+def compile_rule_sets() -> Dict[str, CompiledRules]:
+    """
+    (Re)build the index for every state (built-in rules + rule packs).
+    Reuses the on-disk compiled index when neither the rules nor the packs changed.
+    """
+    global _COMPILED, _GENERATION
+    with _compile_lock:
+        key = _compiled_cache_key()
+        compiled = None
+        data = load_compiled(RULE_CACHE_DIR, key)
+        if data is not None:
+            try:
+                compiled = _compiled_from_data(data)
+            except (KeyError, TypeError, ValueError, AttributeError) as e:
+                print(f"Rule cache unreadable, rebuilding: {e}")
+        if compiled is None:
+            compiled = {state: compile_rules(rules) for state, rules in _merged_rules().items()}
+            save_compiled(RULE_CACHE_DIR, key, _compiled_to_data(compiled))
+        _COMPILED = compiled
+        _GENERATION += 1  # memo keys include this, so old entries just age out
+    return _COMPILED
+
+
+def reload_rule_packs(force: bool = False) -> bool:
+    """Hot reload: recompile if a pack file was added, edited or removed. Returns True if it did."""
+    if _pack_loader.refresh(force=force):
+        compile_rule_sets()
+        return True
+    return False
+
+
+_COMPILED: Dict[str, CompiledRules] = {}
+_GENERATION = 0
+_retrieve_memo = _Memo(RULES_MEMO_MAX_ENTRIES)
+_context_memo = _Memo(RULES_MEMO_MAX_ENTRIES)
+_format_memo = _Memo(RULES_MEMO_MAX_ENTRIES)
+_pack_loader.refresh(force=True)
+compile_rule_sets()
+
+
+def _keyword_levels(compiled: CompiledRules, message: str) -> Dict[str, int]:
+    """Matched keyword -> weight: phrase 3, exact token 2, substring 1 (e.g. "rhymes" vs "rhyme")."""
+    tokens = set(_tokenize(message))
+    levels: Dict[str, int] = {}
+    for hit in compiled.matcher.find_all(_normalize(message)):
+        if hit in compiled.phrases:
+            levels[hit] = 3
+        else:
+            levels[hit] = 2 if hit in tokens else 1
+    return levels
+
+
+def _scores_from_levels(compiled: CompiledRules, levels: Dict[str, int]) -> Dict[int, int]:
+    scores: Dict[int, int] = defaultdict(int)
+    for hit, weight in levels.items():
+        for rid in compiled.phrases.get(hit) or compiled.keywords[hit]:
+            scores[rid] += weight
+    return scores
 
-        if score > 0:
-            scored.append((score, rule))
 
-    scored.sort(key=lambda x: x[0], reverse=True)
-    top = [r for _, r in scored][:limit]
+def _score_keyword(compiled: CompiledRules, message: str) -> Dict[int, int]:
+    return _scores_from_levels(compiled, _keyword_levels(compiled, message))
+
+
+def _get_bm25(compiled: CompiledRules):
+    if compiled.bm25 is None:
+        from src.agents.rule_ranking import BM25RuleRanker
+        compiled.bm25 = BM25RuleRanker(compiled.rules)
+    return compiled.bm25
+
+
+def _get_embeddings(compiled: CompiledRules, state: str):
+    if compiled.embeddings is None:
+        from src.agents.rule_embeddings import RuleEmbeddingIndex
+        compiled.embeddings = RuleEmbeddingIndex(compiled.rules, dim=RULE_EMBED_DIM, cache_dir=RULE_CACHE_DIR,
+                                                 name=state)
+    return compiled.embeddings
+
+
+def _top_keyword(scores: Dict[int, int], limit: int) -> List[int]:
+    # highest score first, ties keep rule order
+    best = heapq.nsmallest(limit, ((-s, rid) for rid, s in scores.items() if s > 0))
+    return [rid for _, rid in best]
+
+
+def _rank_keyword(compiled: CompiledRules, message: str, limit: int) -> List[int]:
+    return _top_keyword(_score_keyword(compiled, message), limit)
+
+
+def _rank_hybrid(compiled: CompiledRules, state: str, message: str, limit: int) -> List[int]:
+    from src.agents.rank_utils import top_k
+    from src.agents.rule_embeddings import fuse_scores
+    fused = fuse_scores(
+        _get_embeddings(compiled, state).score(message),
+        _score_keyword(compiled, message),
+        RULES_HYBRID_SEMANTIC_WEIGHT,
+        RULES_SEMANTIC_MIN_SCORE,
+    )
+    return top_k(fused, limit)
+
+
+def _rank(compiled: CompiledRules, state: str, message: str, limit: int, mode: str) -> List[int]:
+    if mode == "keyword":
+        return _rank_keyword(compiled, message, limit)
+    if mode == "bm25":
+        return _get_bm25(compiled).rank(message, limit)
+    if mode == "semantic":
+        return _get_embeddings(compiled, state).rank(message, limit, RULES_SEMANTIC_MIN_SCORE)
+    if mode == "hybrid":
+        return _rank_hybrid(compiled, state, message, limit)
+    raise ValueError(f"Unknown rules ranking mode: {mode}")
+
+
+def _with_fallback(compiled: CompiledRules, rule_ids: List[int], state: str, limit: int) -> List[Dict[str, Any]]:
+    top = [compiled.rules[rid] for rid in rule_ids]
 
     # fallback: always provide something
     if not top:
@@ -127,10 +352,109 @@ def retrieve_rules(message: str, state: str, limit: int = 3) -> List[Dict[str, A
     return top
 
 
+def retrieve_rules(message: str, state: str, limit: int = 3, mode: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Select relevant rules for the current state.
+    mode: "keyword" (keyword + phrase matching), "bm25", "semantic" (local n-gram
+    embeddings) or "hybrid" (semantic + keyword); default RULES_RANKING_MODE.
+    Returns list of rule dicts.
+    """
+    reload_rule_packs()
+    state = (state or "").upper().strip()
+    compiled = _COMPILED.get(state)
+    if compiled is None or not compiled.rules:
+        return []
+
+    mode = (mode or RULES_RANKING_MODE).lower()
+    # reruns re-send mostly the same text; whitespace/case never change the ranking
+    key = _memo_key(_GENERATION, state, mode, limit, _normalize(message))
+    cached = _retrieve_memo.get(key)
+    if cached is not None:
+        return list(cached)
+
+    rule_ids = _rank(compiled, state, message, limit, mode)
+    top = _with_fallback(compiled, rule_ids, state, limit)
+    _retrieve_memo.set(key, tuple(top))
+    return top
+
+
+def retrieve_rules_incremental(message: str, context: str, state: str, limit: int = 3,
+                               mode: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Same as retrieve_rules(message + "\n" + context) but, in keyword mode, the
+    static song context (title/intent/melody/lyrics) is matched once and its
+    per-keyword weights are memoized; each new message only adds its own.
+    Weights combine by max, which equals matching the joined text except for a
+    phrase/substring that would span the message/context boundary.
+    Other modes fall back to retrieve_rules on the joined text.
+    """
+    mode = (mode or RULES_RANKING_MODE).lower()
+    if mode != "keyword":
+        return retrieve_rules(f"{message}\n{context}", state, limit, mode=mode)
+
+    reload_rule_packs()
+    state = (state or "").upper().strip()
+    compiled = _COMPILED.get(state)
+    if compiled is None or not compiled.rules:
+        return []
+
+    ctx_key = _memo_key(_GENERATION, state, _normalize(context))
+    ctx_levels = _context_memo.get(ctx_key)
+    if ctx_levels is None:
+        ctx_levels = _keyword_levels(compiled, context)
+        _context_memo.set(ctx_key, ctx_levels)
+
+    levels = dict(ctx_levels)
+    for hit, weight in _keyword_levels(compiled, message).items():
+        if weight > levels.get(hit, 0):
+            levels[hit] = weight
+
+    rule_ids = _top_keyword(_scores_from_levels(compiled, levels), limit)
+    return _with_fallback(compiled, rule_ids, state, limit)
+
+
+def retrieve_rules_batch(messages: List[str], state: str, limit: int = 3,
+                         mode: Optional[str] = None) -> List[List[Dict[str, Any]]]:
+    """retrieve_rules for many messages at once (bm25/semantic score them in one matrix product)."""
+    reload_rule_packs()
+    state = (state or "").upper().strip()
+    compiled = _COMPILED.get(state)
+    if compiled is None or not compiled.rules:
+        return [[] for _ in messages]
+
+    mode = (mode or RULES_RANKING_MODE).lower()
+    if mode == "bm25":
+        ranked = _get_bm25(compiled).rank_batch(messages, limit)
+        return [_with_fallback(compiled, ids, state, limit) for ids in ranked]
+    if mode == "semantic":
+        from src.agents.rank_utils import top_k
+        matrix = _get_embeddings(compiled, state).score_batch(messages)
+        matrix[matrix < RULES_SEMANTIC_MIN_SCORE] = 0.0
+        ranked = [top_k(row, limit) for row in matrix]
+        return [_with_fallback(compiled, ids, state, limit) for ids in ranked]
+    return [retrieve_rules(m, state, limit, mode=mode) for m in messages]
+
+
 def format_rules_for_prompt(rules: List[Dict[str, Any]]) -> str:
     if not rules:
         return ""
+    key = _memo_key(*(r["rule"] for r in rules))
+    cached = _format_memo.get(key)
+    if cached is not None:
+        return cached
+
     lines = ["DYNAMIC GUIDE RULES (apply if relevant):"]
     for r in rules:
         lines.append(f"- {r['rule']}")
-    return "\n".join(lines) + "\n"
+    block = "\n".join(lines) + "\n"
+    _format_memo.set(key, block)
+    return block
+
+
+def rule_memo_stats() -> Dict[str, Dict[str, Any]]:
+    """Hit/miss counters of the retrieval memos (for the Stats page)."""
+    return {
+        "retrieve_rules": _retrieve_memo.stats(),
+        "song_context": _context_memo.stats(),
+        "format_rules_for_prompt": _format_memo.stats(),
+    }
@@ -0,0 +1,181 @@
+"""
+LLM backends for ECHO application.
+BaseAgent talks to an LLMBackend; which one is picked by LLM_BACKEND in settings:
+- "gemini": the real Gemini API (google-genai)
+- "fake":   in-process deterministic stand-in for load tests / benchmarks (no quota spent)
+"""
+
+import asyncio
+import hashlib
+import json
+import random
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, Iterator, List, Optional
+
+from google import genai
+
+
+class LLMBackend(ABC):
+    """
+    Interface every backend implements. `config` is the google-genai style config dict.
+    If `usage` is given, the backend fills "input_tokens" / "output_tokens" in it.
+    """
+
+    name = "base"
+
+    # key for the shared rate limiter / circuit breaker (one per upstream account)
+    rate_limit_key = "base"
+
+    @abstractmethod
+    def generate(self, model: str, contents: List[Dict], config: Dict, usage: Optional[Dict] = None) -> str:
+        ...
+
+    @abstractmethod
+    def generate_stream(self, model: str, contents: List[Dict], config: Dict,
+                        usage: Optional[Dict] = None) -> Iterator[str]:
+        ...
+
+    @abstractmethod
+    async def generate_async(self, model: str, contents: List[Dict], config: Dict,
+                             usage: Optional[Dict] = None) -> str:
+        ...
+
+
+def _fill_usage(usage: Optional[Dict], resp) -> None:
+    meta = getattr(resp, "usage_metadata", None)
+    if usage is None or meta is None:
+        return
+    if getattr(meta, "prompt_token_count", None) is not None:
+        usage["input_tokens"] = meta.prompt_token_count
+    if getattr(meta, "candidates_token_count", None) is not None:
+        usage["output_tokens"] = meta.candidates_token_count
+
+
+class GeminiBackend(LLMBackend):
+    name = "gemini"
+
+    def __init__(self, client: genai.Client, api_key: str):
+        self.client = client
+        self.rate_limit_key = api_key
+
+    def generate(self, model: str, contents: List[Dict], config: Dict, usage: Optional[Dict] = None) -> str:
+        resp = self.client.models.generate_content(model=model, contents=contents, config=config)
+        _fill_usage(usage, resp)
+        return (resp.text or "").strip()
+
+    def generate_stream(self, model: str, contents: List[Dict], config: Dict,
+                        usage: Optional[Dict] = None) -> Iterator[str]:
+        for chunk in self.client.models.generate_content_stream(model=model, contents=contents, config=config):
+            # usage metadata is cumulative; the last chunk carries the totals
+            _fill_usage(usage, chunk)
+            text = chunk.text or ""
+            if text:
+                yield text
+
+    async def generate_async(self, model: str, contents: List[Dict], config: Dict,
+                             usage: Optional[Dict] = None) -> str:
+        resp = await self.client.aio.models.generate_content(model=model, contents=contents, config=config)
+        _fill_usage(usage, resp)
+        return (resp.text or "").strip()
+
+
+class FakeBackendError(Exception):
+    """Injected upstream failure (looks like a 503 to the retry logic)."""
+
+    code = 503
+
+
+_FAKE_WORDS = (
+    "try", "a", "shorter", "line", "with", "one", "clear", "image", "keep", "the", "rhyme",
+    "loose", "lift", "chorus", "hook", "tempo", "groove", "verse", "detail", "feel", "simple",
+)
+
+
+class FakeBackend(LLMBackend):
+    """
+    Deterministic in-process stand-in for Gemini.
+    - same prompt -> same answer text (hash-seeded)
+    - latency: "fixed" | "uniform" | "lognormal" around latency_ms (+ time-to-first-token)
+    - error_rate: fraction of calls failing with FakeBackendError (503)
+    - response_words: answer size
+    Latency/error draws come from one seeded RNG so a whole run is reproducible.
+    """
+
+    name = "fake"
+    rate_limit_key = "fake"
+
+    def __init__(self, latency_ms: float = 400, latency_dist: str = "lognormal", ttft_ms: float = 150,
+                 error_rate: float = 0.0, response_words: int = 40, chunk_words: int = 5, seed: int = 0):
+        self.latency_ms = latency_ms
+        self.latency_dist = latency_dist
+        self.ttft_ms = ttft_ms
+        self.error_rate = error_rate
+        self.response_words = response_words
+        self.chunk_words = max(1, chunk_words)
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+
+    def _draw_latency(self) -> float:
+        with self._rng_lock:
+            if self.latency_dist == "fixed":
+                ms = self.latency_ms
+            elif self.latency_dist == "uniform":
+                ms = self._rng.uniform(0.5 * self.latency_ms, 1.5 * self.latency_ms)
+            else:
+                # lognormal with median latency_ms -> realistic long tail
+                ms = self.latency_ms * self._rng.lognormvariate(0, 0.5)
+        return ms / 1000.0
+
+    def _maybe_fail(self) -> None:
+        with self._rng_lock:
+            failed = self._rng.random() < self.error_rate
+        if failed:
+            raise FakeBackendError("fake backend: injected 503")
+
+    @staticmethod
+    def _fill_usage(usage: Optional[Dict], contents: List[Dict], words: List[str]) -> None:
+        if usage is None:
+            return
+        prompt_chars = sum(len(p.get("text", "")) for c in contents for p in c.get("parts", []))
+        usage["input_tokens"] = (prompt_chars + 3) // 4
+        usage["output_tokens"] = len(words)
+
+    def _answer_words(self, model: str, contents: List[Dict], config: Dict) -> List[str]:
+        digest = hashlib.sha256(
+            json.dumps([model, contents, config], sort_keys=True, default=str).encode("utf-8")
+        ).digest()
+        rng = random.Random(digest)
+        return [rng.choice(_FAKE_WORDS) for _ in range(self.response_words)]
+
+    def generate(self, model: str, contents: List[Dict], config: Dict, usage: Optional[Dict] = None) -> str:
+        time.sleep(self._draw_latency())
+        self._maybe_fail()
+        words = self._answer_words(model, contents, config)
+        self._fill_usage(usage, contents, words)
+        return " ".join(words)
+
+    def generate_stream(self, model: str, contents: List[Dict], config: Dict,
+                        usage: Optional[Dict] = None) -> Iterator[str]:
+        total = self._draw_latency()
+        ttft = min(total, self.ttft_ms / 1000.0)
+        time.sleep(ttft)
+        self._maybe_fail()
+
+        words = self._answer_words(model, contents, config)
+        self._fill_usage(usage, contents, words)
+        chunks = [words[i:i + self.chunk_words] for i in range(0, len(words), self.chunk_words)]
+        gap = (total - ttft) / max(1, len(chunks) - 1)
+        for i, chunk in enumerate(chunks):
+            if i:
+                time.sleep(gap)
+            yield (" " if i else "") + " ".join(chunk)
+
+    async def generate_async(self, model: str, contents: List[Dict], config: Dict,
+                             usage: Optional[Dict] = None) -> str:
+        await asyncio.sleep(self._draw_latency())
+        self._maybe_fail()
+        words = self._answer_words(model, contents, config)
+        self._fill_usage(usage, contents, words)
+        return " ".join(words)
@@ -0,0 +1,174 @@
+"""
+Per-call LLM instrumentation for ECHO application.
+Every agent call produces a CallRecord; records are aggregated into in-process
+histograms/counters that the Stats page shows and that can be exported in
+Prometheus text format.
+"""
+
+import bisect
+import threading
+from collections import defaultdict, deque
+from dataclasses import dataclass, asdict
+from typing import Deque, Dict, List, Optional, Tuple
+
+# seconds; covers cache hits (sub-ms) up to slow, retried generations
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+
+
+@dataclass
+class CallRecord:
+    agent: str
+    kind: str  # "sync" | "async" | "stream"
+    backend: str = ""
+    wall_s: float = 0.0
+    ttft_s: Optional[float] = None  # streams only
+    input_tokens: Optional[int] = None
+    output_tokens: Optional[int] = None
+    cache_hit: bool = False
+    shared: bool = False  # answered by another caller's in-flight request
+    retries: int = 0
+    error: Optional[str] = None  # exception class name
+
+
+class Histogram:
+    """Cumulative-bucket histogram (Prometheus style) with bucket-interpolated quantiles."""
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last = +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            if c and seen + c >= rank:
+                lo = self.buckets[i - 1] if i > 0 else 0.0
+                hi = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return lo + (hi - lo) * ((rank - seen) / c)
+            seen += c
+        return self.buckets[-1]
+
+
+class MetricsRegistry:
+    """Thread-safe aggregation of CallRecords, labelled by (agent, kind)."""
+
+    def __init__(self, keep_recent: int = 200):
+        self._lock = threading.Lock()
+        self.latency: Dict[Tuple[str, str], Histogram] = defaultdict(lambda: Histogram(LATENCY_BUCKETS))
+        self.ttft: Dict[Tuple[str, str], Histogram] = defaultdict(lambda: Histogram(LATENCY_BUCKETS))
+        self.input_tokens: Dict[Tuple[str, str], Histogram] = defaultdict(lambda: Histogram(TOKEN_BUCKETS))
+        self.output_tokens: Dict[Tuple[str, str], Histogram] = defaultdict(lambda: Histogram(TOKEN_BUCKETS))
+        self.calls: Dict[Tuple[str, str], int] = defaultdict(int)
+        self.cache_hits: Dict[Tuple[str, str], int] = defaultdict(int)
+        self.shared: Dict[Tuple[str, str], int] = defaultdict(int)
+        self.retries: Dict[Tuple[str, str], int] = defaultdict(int)
+        self.errors: Dict[Tuple[str, str, str], int] = defaultdict(int)
+        self.recent: Deque[CallRecord] = deque(maxlen=keep_recent)
+
+    def record(self, rec: CallRecord) -> None:
+        labels = (rec.agent, rec.kind)
+        with self._lock:
+            self.calls[labels] += 1
+            self.latency[labels].observe(rec.wall_s)
+            if rec.ttft_s is not None:
+                self.ttft[labels].observe(rec.ttft_s)
+            if rec.input_tokens is not None:
+                self.input_tokens[labels].observe(rec.input_tokens)
+            if rec.output_tokens is not None:
+                self.output_tokens[labels].observe(rec.output_tokens)
+            if rec.cache_hit:
+                self.cache_hits[labels] += 1
+            if rec.shared:
+                self.shared[labels] += 1
+            self.retries[labels] += rec.retries
+            if rec.error:
+                self.errors[(rec.agent, rec.kind, rec.error)] += 1
+            self.recent.append(rec)
+
+    def summary(self) -> List[Dict]:
+        """One row per (agent, kind): counts + p50/p95/p99 latency and TTFT (seconds)."""
+        with self._lock:
+            rows = []
+            for labels in sorted(self.calls):
+                lat = self.latency[labels]
+                ttft = self.ttft.get(labels)
+                rows.append({
+                    "agent": labels[0],
+                    "kind": labels[1],
+                    "calls": self.calls[labels],
+                    "cache_hits": self.cache_hits[labels],
+                    "shared": self.shared[labels],
+                    "retries": self.retries[labels],
+                    "errors": sum(n for (a, k, _), n in self.errors.items() if (a, k) == labels),
+                    "p50_s": lat.quantile(0.50),
+                    "p95_s": lat.quantile(0.95),
+                    "p99_s": lat.quantile(0.99),
+                    "ttft_p95_s": ttft.quantile(0.95) if ttft else None,
+                })
+            return rows
+
+    def recent_calls(self) -> List[Dict]:
+        with self._lock:
+            return [asdict(r) for r in reversed(self.recent)]
+
+    def render_prometheus(self) -> str:
+        """Prometheus text exposition format (0.0.4)."""
+        out: List[str] = []
+
+        def labels_str(agent: str, kind: str, extra: str = "") -> str:
+            return f'agent="{agent}",kind="{kind}"' + (f",{extra}" if extra else "")
+
+        def hist(name: str, help_text: str, series: Dict[Tuple[str, str], Histogram]) -> None:
+            out.append(f"# HELP {name} {help_text}")
+            out.append(f"# TYPE {name} histogram")
+            for (agent, kind), h in sorted(series.items()):
+                cumulative = 0
+                for bound, c in zip(h.buckets, h.counts):
+                    cumulative += c
+                    le = 'le="%s"' % bound
+                    out.append(f"{name}_bucket{{{labels_str(agent, kind, le)}}} {cumulative}")
+                le = 'le="+Inf"'
+                out.append(f"{name}_bucket{{{labels_str(agent, kind, le)}}} {h.count}")
+                out.append(f"{name}_sum{{{labels_str(agent, kind)}}} {h.sum}")
+                out.append(f"{name}_count{{{labels_str(agent, kind)}}} {h.count}")
+
+        def counter(name: str, help_text: str, series: Dict[Tuple[str, str], int]) -> None:
+            out.append(f"# HELP {name} {help_text}")
+            out.append(f"# TYPE {name} counter")
+            for (agent, kind), v in sorted(series.items()):
+                out.append(f"{name}{{{labels_str(agent, kind)}}} {v}")
+
+        with self._lock:
+            hist("echo_llm_call_seconds", "Wall time of agent calls.", self.latency)
+            hist("echo_llm_ttft_seconds", "Time to first streamed token.", self.ttft)
+            hist("echo_llm_input_tokens", "Prompt tokens per call.", self.input_tokens)
+            hist("echo_llm_output_tokens", "Response tokens per call.", self.output_tokens)
+            counter("echo_llm_calls_total", "Agent calls.", self.calls)
+            counter("echo_llm_cache_hits_total", "Calls answered from the response cache.", self.cache_hits)
+            counter("echo_llm_shared_total", "Calls coalesced onto an in-flight request.", self.shared)
+            counter("echo_llm_retries_total", "Upstream retries.", self.retries)
+
+            out.append("# HELP echo_llm_errors_total Failed agent calls by error class.")
+            out.append("# TYPE echo_llm_errors_total counter")
+            for (agent, kind, err), v in sorted(self.errors.items()):
+                error_label = 'error="%s"' % err
+                out.append(f"echo_llm_errors_total{{{labels_str(agent, kind, error_label)}}} {v}")
+
+        return "\n".join(out) + "\n"
+
+
+_metrics = MetricsRegistry()
+
+
+def get_metrics() -> MetricsRegistry:
+    return _metrics
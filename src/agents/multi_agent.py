@@ -0,0 +1,42 @@
+"""
+Multi-agent fan-out for ECHO application.
+Ask several agents the same question at once (one round trip instead of N).
+"""
+
+import asyncio
+from typing import Dict, List, Optional
+
+from src.agents.base_agent import BaseAgent
+from src.agents.registry import get_lyrics_agent, get_melody_agent
+from src.config.settings import MODE_LYRICS, MODE_MELODY
+
+
+async def gather_responses(
+        agents: Dict[str, BaseAgent],
+        user_message: str,
+        song_snapshot,
+        chat_history: Optional[List[Dict]] = None
+) -> Dict[str, str]:
+    """Query every agent concurrently. Returns {name: response}, same keys as `agents`."""
+    names = list(agents.keys())
+    results = await asyncio.gather(*[
+        agents[name].get_response_async(user_message, song_snapshot, chat_history)
+        for name in names
+    ])
+    return dict(zip(names, results))
+
+
+def ask_lyrics_and_melody(
+        user_message: str,
+        song_snapshot,
+        chat_history: Optional[List[Dict]] = None
+) -> Dict[str, str]:
+    """
+    Get a LYRICS and a MELODY answer for the same message, generated in parallel.
+    Sync entry point for the Streamlit script thread (no running event loop there).
+    """
+    agents = {
+        MODE_LYRICS: get_lyrics_agent(),
+        MODE_MELODY: get_melody_agent(),
+    }
+    return asyncio.run(gather_responses(agents, user_message, song_snapshot, chat_history))
@@ -0,0 +1,80 @@
+"""
+Aho-Corasick multi-pattern matcher for the rule keywords.
+Finds every keyword/phrase occurring in a text in one linear pass,
+however many patterns there are.
+"""
+
+from collections import deque
+from typing import Any, Dict, Iterable, List, Set
+
+
+class AhoCorasick:
+    """Build once from the patterns, then `find_all(text)` -> set of patterns found (substring semantics)."""
+
+    def __init__(self, patterns: Iterable[str]):
+        # node 0 is the root; per node: transitions, failure link, patterns ending here
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[str]] = [[]]
+
+        for pat in set(p for p in patterns if p):
+            self._add(pat)
+        self._build_links()
+
+    def __len__(self) -> int:
+        return len(self._goto)
+
+    def to_state(self) -> Dict[str, Any]:
+        """The built automaton as plain lists/dicts (JSON-safe), see from_state."""
+        return {"goto": self._goto, "fail": self._fail, "out": self._out}
+
+    @classmethod
+    def from_state(cls, state: Dict[str, Any]) -> "AhoCorasick":
+        """Rebuild from to_state() output without re-inserting the patterns."""
+        matcher = cls.__new__(cls)
+        matcher._goto = [{str(ch): int(n) for ch, n in g.items()} for g in state["goto"]]
+        matcher._fail = [int(f) for f in state["fail"]]
+        matcher._out = [[str(p) for p in o] for o in state["out"]]
+        if not len(matcher._goto) == len(matcher._fail) == len(matcher._out):
+            raise ValueError("Inconsistent Aho-Corasick state")
+        return matcher
+
+    def _add(self, pattern: str) -> None:
+        node = 0
+        for ch in pattern:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        self._out[node].append(pattern)
+
+    def _build_links(self) -> None:
+        # BFS: a node's failure link is the longest proper suffix that is also a trie path
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                target = self._goto[f].get(ch, 0)
+                self._fail[child] = target if target != child else 0
+                # inherit matches that end at the suffix node
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def find_all(self, text: str) -> Set[str]:
+        found: Set[str] = set()
+        goto, fail, out = self._goto, self._fail, self._out
+        node = 0
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if out[node]:
+                found.update(out[node])
+        return found
@@ -0,0 +1,17 @@
+"""
+Small numpy-only helpers shared by the rule rankers (BM25, embeddings, hybrid).
+"""
+
+from typing import List
+
+import numpy as np
+
+
+def top_k(scores: np.ndarray, limit: int) -> List[int]:
+    """Indices of the `limit` best positive scores, best first (ties: lower index first)."""
+    if limit <= 0 or scores.size == 0:
+        return []
+    k = min(limit, scores.size)
+    cand = np.argpartition(-scores, k - 1)[:k]
+    cand = cand[np.lexsort((cand, -scores[cand]))]
+    return [int(i) for i in cand if scores[i] > 0]
@@ -0,0 +1,100 @@
+"""
+Process-wide agent registry for ECHO application.
+One LLM backend (Gemini client or fake) and one agent per mode,
+shared by every Streamlit session.
+"""
+
+import os
+import threading
+from typing import Dict, Optional
+
+from google import genai
+
+from src.agents.llm_backends import LLMBackend, GeminiBackend, FakeBackend
+from src.config.settings import (
+    MODE_LYRICS, MODE_MELODY, LLM_BACKEND,
+    FAKE_LLM_LATENCY_MS, FAKE_LLM_LATENCY_DIST, FAKE_LLM_TTFT_MS,
+    FAKE_LLM_ERROR_RATE, FAKE_LLM_RESPONSE_WORDS, FAKE_LLM_SEED,
+)
+
+_lock = threading.RLock()
+_client: Optional[genai.Client] = None
+_backend: Optional[LLMBackend] = None
+_agents: Dict[str, object] = {}
+
+
+def get_shared_client() -> genai.Client:
+    """Return the single genai.Client of this process (built on first use)."""
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                api_key = os.getenv("GEMINI_API_KEY")
+                if not api_key:
+                    raise ValueError("GEMINI_API_KEY not found in environment variables")
+                _client = genai.Client(api_key=api_key)
+    return _client
+
+
+def get_shared_backend() -> LLMBackend:
+    """Return the process's LLM backend, chosen by LLM_BACKEND ("gemini" / "fake")."""
+    global _backend
+    if _backend is None:
+        with _lock:
+            if _backend is None:
+                kind = (LLM_BACKEND or "gemini").lower().strip()
+                if kind == "fake":
+                    _backend = FakeBackend(
+                        latency_ms=FAKE_LLM_LATENCY_MS,
+                        latency_dist=FAKE_LLM_LATENCY_DIST,
+                        ttft_ms=FAKE_LLM_TTFT_MS,
+                        error_rate=FAKE_LLM_ERROR_RATE,
+                        response_words=FAKE_LLM_RESPONSE_WORDS,
+                        seed=FAKE_LLM_SEED,
+                    )
+                elif kind == "gemini":
+                    _backend = GeminiBackend(get_shared_client(), os.getenv("GEMINI_API_KEY") or "")
+                else:
+                    raise ValueError(f"Unknown LLM_BACKEND: {LLM_BACKEND}")
+    return _backend
+
+
+def get_agent(mode: str):
+    """Return the shared agent for a mode ("LYRICS" / "MELODY")."""
+    mode = (mode or "").upper().strip()
+    agent = _agents.get(mode)
+    if agent is not None:
+        return agent
+
+    # imported here to avoid a cycle (agents import base_agent, base_agent imports us)
+    from src.agents.lyrics_agent import LyricsAgent
+    from src.agents.melody_agent import MelodyAgent
+
+    with _lock:
+        agent = _agents.get(mode)
+        if agent is None:
+            if mode == MODE_LYRICS:
+                agent = LyricsAgent()
+            elif mode == MODE_MELODY:
+                agent = MelodyAgent()
+            else:
+                raise ValueError(f"Unknown agent mode: {mode}")
+            _agents[mode] = agent
+    return agent
+
+
+def get_lyrics_agent():
+    return get_agent(MODE_LYRICS)
+
+
+def get_melody_agent():
+    return get_agent(MODE_MELODY)
+
+
+def reset_registry() -> None:
+    """Drop the shared client, backend and agents (next call rebuilds them)."""
+    global _client, _backend
+    with _lock:
+        _client = None
+        _backend = None
+        _agents.clear()
@@ -0,0 +1,248 @@
+"""
+Resilience helpers for Gemini calls in ECHO application.
+Shared token-bucket rate limiter (per API key), retry with exponential
+backoff + jitter, and a circuit breaker that fails fast while upstream is down.
+"""
+
+import random
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from src.config.settings import (
+    GEMINI_RATE_LIMIT_PER_SEC, GEMINI_RATE_LIMIT_BURST,
+    GEMINI_RETRY_ATTEMPTS, GEMINI_RETRY_BASE_DELAY, GEMINI_RETRY_MAX_DELAY,
+    GEMINI_BREAKER_FAILURES, GEMINI_BREAKER_COOLDOWN,
+)
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+# transport errors of the HTTP stacks under google-genai (requests in older
+# releases, httpx in newer ones): timeouts, resets, refused connections
+_TRANSPORT_ERRORS = [TimeoutError, ConnectionError]
+try:
+    import requests
+    _TRANSPORT_ERRORS += [requests.exceptions.ConnectionError, requests.exceptions.Timeout]
+except ImportError:
+    pass
+try:
+    import httpx
+    _TRANSPORT_ERRORS.append(httpx.TransportError)  # incl. ReadTimeout, ConnectError, RemoteProtocolError
+except ImportError:
+    pass
+TRANSPORT_ERRORS = tuple(_TRANSPORT_ERRORS)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling upstream while the breaker is open."""
+
+
+class RateLimitTimeout(Exception):
+    """Raised when no rate-limit token became available in time."""
+
+
+def is_retryable(exc: Exception) -> bool:
+    """429 / 5xx / timeouts / connection errors are worth another try."""
+    code = getattr(exc, "code", None) or getattr(exc, "status_code", None)
+    if isinstance(code, int):
+        return code in RETRYABLE_STATUS
+    return isinstance(exc, TRANSPORT_ERRORS)
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens/sec, at most `capacity` stored."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self) -> float:
+        """Take a token if possible. Returns 0 on success, else seconds to wait."""
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self, timeout: Optional[float] = None) -> None:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self.try_acquire()
+            if wait == 0:
+                return
+            if deadline is not None and time.monotonic() + wait > deadline:
+                raise RateLimitTimeout("rate limit: no token available")
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    """
+    closed -> (N consecutive failures) -> open -> (cooldown) -> half-open
+    half-open lets one trial call through: success closes, failure re-opens,
+    and a trial abandoned without an outcome (cancelled, stream closed) is
+    released so the next call can be the trial.
+    """
+
+    def __init__(self, failure_threshold: int, cooldown_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self.cooldown_seconds:
+                return "half-open"
+            return "open"
+
+    @property
+    def trial_running(self) -> bool:
+        with self._lock:
+            return self._trial_running
+
+    def admit(self) -> Optional[bool]:
+        """None = rejected, True = let through as the half-open trial, False = let through (closed)."""
+        with self._lock:
+            if self._opened_at is None:
+                return False
+            if time.monotonic() - self._opened_at < self.cooldown_seconds:
+                return None
+            if self._trial_running:
+                return None
+            self._trial_running = True
+            return True
+
+    def allow(self) -> bool:
+        return self.admit() is not None
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._trial_running or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._trial_running = False
+
+    def release_trial(self) -> None:
+        """The trial call ended without a result: stay half-open, let another call try."""
+        with self._lock:
+            self._trial_running = False
+
+
+def backoff_delay(attempt: int, base: float, max_delay: float) -> float:
+    """Full-jitter exponential backoff (attempt starts at 0)."""
+    return random.uniform(0, min(max_delay, base * (2 ** attempt)))
+
+
+class ResilientCaller:
+    """Rate limit + retry/backoff + circuit breaker around one upstream (one API key)."""
+
+    def __init__(self, bucket: TokenBucket, breaker: CircuitBreaker,
+                 attempts: int = 3, base_delay: float = 0.5, max_delay: float = 8.0):
+        self.bucket = bucket
+        self.breaker = breaker
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retries = 0
+
+    def before_call(self) -> bool:
+        """
+        Gate one attempt: breaker first (fail fast), then a rate-limit token (may block).
+        Returns True if this attempt is the half-open trial; pass that to abandon()
+        if the attempt ends without recording a success or failure.
+        """
+        if self.breaker.state == "open":
+            raise CircuitOpenError("Gemini circuit is open")
+        self.bucket.acquire(timeout=self.max_delay)
+        trial = self.breaker.admit()
+        if trial is None:
+            raise CircuitOpenError("Gemini circuit is open")
+        return trial
+
+    def abandon(self, trial: bool) -> None:
+        """An attempt was cut off (GeneratorExit, CancelledError, ...): free the trial slot it held."""
+        if trial:
+            self.breaker.release_trial()
+
+    def record_success(self) -> None:
+        self.breaker.record_success()
+
+    def record_failure(self, exc: Exception) -> bool:
+        """Record a failed attempt on the breaker. Returns whether it is retryable."""
+        if not is_retryable(exc):
+            # upstream answered (e.g. 400) -> it is healthy, the request is the problem
+            self.breaker.record_success()
+            return False
+        self.breaker.record_failure()
+        return True
+
+    def retry_delay(self, exc: Exception, attempt: int) -> Optional[float]:
+        """Record a failed attempt. Returns seconds to wait before retrying, or None to give up."""
+        if not self.record_failure(exc) or attempt + 1 >= self.attempts:
+            return None
+        self.retries += 1
+        return backoff_delay(attempt, self.base_delay, self.max_delay)
+
+    def call(self, fn: Callable, on_retry: Optional[Callable[[], None]] = None):
+        """Run fn() with the full policy. Raises the last error if every attempt fails."""
+        attempt = 0
+        while True:
+            trial = self.before_call()
+            try:
+                result = fn()
+            except Exception as e:
+                delay = self.retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                if on_retry is not None:
+                    on_retry()
+                time.sleep(delay)
+                attempt += 1
+                continue
+            except BaseException:
+                self.abandon(trial)
+                raise
+            self.record_success()
+            return result
+
+
+_callers: Dict[str, ResilientCaller] = {}
+_callers_lock = threading.Lock()
+
+
+def get_caller(api_key: str) -> ResilientCaller:
+    """One shared limiter/breaker per API key for the whole process."""
+    caller = _callers.get(api_key)
+    if caller is None:
+        with _callers_lock:
+            caller = _callers.get(api_key)
+            if caller is None:
+                caller = ResilientCaller(
+                    TokenBucket(GEMINI_RATE_LIMIT_PER_SEC, GEMINI_RATE_LIMIT_BURST),
+                    CircuitBreaker(GEMINI_BREAKER_FAILURES, GEMINI_BREAKER_COOLDOWN),
+                    attempts=GEMINI_RETRY_ATTEMPTS,
+                    base_delay=GEMINI_RETRY_BASE_DELAY,
+                    max_delay=GEMINI_RETRY_MAX_DELAY,
+                )
+                _callers[api_key] = caller
+    return caller
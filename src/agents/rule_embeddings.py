@@ -0,0 +1,156 @@
+"""
+Offline semantic rule retrieval for the knowledge base.
+Texts are embedded locally with hashed character n-grams (no model download,
+no network). Rule vectors are precomputed into a float32 matrix saved as .npy
+and memory-mapped, so ranking a message is one matrix-vector product.
+"""
+
+import hashlib
+import json
+import os
+import re
+import zlib
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from src.agents.rank_utils import top_k
+
+_WORD_RE = re.compile(r"[a-z']+")
+_NGRAM_SIZES = (3, 4, 5)
+
+_STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "but", "by", "can", "do", "does", "for", "from",
+    "how", "in", "is", "it", "its", "just", "me", "my", "of", "on", "or", "so", "that", "the",
+    "this", "to", "too", "very", "was", "with", "what", "feel", "feels", "make", "should",
+}
+
+# small bundled lexicon: everyday words writers use -> vocabulary the guide rules use.
+# Char n-grams catch spelling variants; this catches the common paraphrases.
+_RELATED = {
+    "stiff": "flow rhythm natural", "clunky": "flow rhythm", "awkward": "flow natural",
+    "robotic": "natural spoken", "wordy": "syllables too long", "long": "syllables",
+    "boring": "generic cliche", "cheesy": "cliche cringe", "corny": "cliche",
+    "vague": "specific details imagery", "abstract": "imagery concrete",
+    "sticky": "hook catchy memorable", "earworm": "hook catchy", "singalong": "hook chorus",
+    "sad": "emotion", "happy": "emotion", "mood": "emotion vibe",
+    "beat": "tempo groove rhythm", "speed": "tempo bpm", "slow": "tempo", "fast": "tempo",
+    "tune": "melody", "notes": "melody range", "high": "range", "low": "range",
+    "instrument": "instruments", "guitar": "instruments", "piano": "instruments", "drums": "instruments groove",
+}
+
+
+def _words(text: str) -> List[str]:
+    words = [w for w in _WORD_RE.findall((text or "").lower()) if w not in _STOPWORDS]
+    extra = []
+    for w in words:
+        if w in _RELATED:
+            extra.extend(_RELATED[w].split())
+    return words + extra
+
+
+def _features(text: str) -> Iterable[str]:
+    for word in _words(text):
+        yield word
+        padded = f" {word} "
+        for n in _NGRAM_SIZES:
+            for i in range(len(padded) - n + 1):
+                yield padded[i:i + n]
+
+
+def embed(text: str, dim: int) -> np.ndarray:
+    """L2-normalized hashed n-gram vector (signed feature hashing, stable across processes)."""
+    vec = np.zeros(dim, dtype=np.float32)
+    for feat in _features(text):
+        h = zlib.crc32(feat.encode("utf-8"))
+        vec[h % dim] += 1.0 if (h >> 31) & 1 else -1.0
+    norm = float(np.linalg.norm(vec))
+    return vec / norm if norm else vec
+
+
+def _rule_text(rule: Dict[str, Any]) -> str:
+    # keywords twice: they are the curated signal (same idea as the BM25 keyword boost)
+    keywords = " ".join(rule.get("keywords", []))
+    return f"{keywords} {keywords} {rule.get('rule', '')}"
+
+
+def _prune_cache(cache_dir: str, name: str, keep: str) -> None:
+    """Drop older embeddings files of the same rule set `name`; other sets keep theirs."""
+    pattern = re.compile(rf"emb_{re.escape(name)}_[0-9a-f]{{32}}\.npy")
+    for fname in os.listdir(cache_dir):
+        if fname != keep and pattern.fullmatch(fname):
+            try:
+                os.remove(os.path.join(cache_dir, fname))
+            except OSError:
+                pass  # still mapped by another process (Windows); removed next time
+
+
+class RuleEmbeddingIndex:
+    """
+    (n_rules x dim) float32 matrix of rule embeddings.
+    With `cache_dir`, the matrix is written once as .npy (named by the rule set
+    `name` and a hash of the rules + dim) and memory-mapped on later loads.
+    """
+
+    def __init__(self, rules: Sequence[Dict[str, Any]], dim: int = 512, cache_dir: Optional[str] = None,
+                 name: str = "rules"):
+        self.dim = dim
+        self.n_rules = len(rules)
+        self.name = re.sub(r"[^a-z0-9]+", "-", name.lower()) or "rules"
+        self.matrix = self._load_or_build(rules, cache_dir)
+
+    def _build(self, rules: Sequence[Dict[str, Any]]) -> np.ndarray:
+        matrix = np.zeros((len(rules), self.dim), dtype=np.float32)
+        for rid, rule in enumerate(rules):
+            matrix[rid] = embed(_rule_text(rule), self.dim)
+        return matrix
+
+    def _load_or_build(self, rules: Sequence[Dict[str, Any]], cache_dir: Optional[str]) -> np.ndarray:
+        if not cache_dir or not rules:
+            return self._build(rules)
+
+        digest = hashlib.sha256(json.dumps([self.dim, list(rules)], sort_keys=True).encode("utf-8")).hexdigest()
+        path = os.path.join(cache_dir, f"emb_{self.name}_{digest[:32]}.npy")
+        if not os.path.exists(path):
+            try:
+                os.makedirs(cache_dir, exist_ok=True)
+                tmp = f"{path}.{os.getpid()}.tmp.npy"
+                np.save(tmp, self._build(rules))
+                os.replace(tmp, path)
+            except OSError as e:
+                print(f"Rule embeddings not cached: {e}")
+                return self._build(rules)
+            _prune_cache(cache_dir, self.name, keep=os.path.basename(path))
+        try:
+            return np.load(path, mmap_mode="r")
+        except (OSError, ValueError) as e:  # pruned by a worker with newer rules, or unreadable
+            print(f"Rule embeddings cache unreadable, rebuilding: {e}")
+            return self._build(rules)
+
+    def score(self, text: str) -> np.ndarray:
+        """Cosine similarity of every rule to the text (one mat-vec product)."""
+        if not self.n_rules:
+            return np.zeros(0, dtype=np.float32)
+        return self.matrix @ embed(text, self.dim)
+
+    def score_batch(self, texts: Sequence[str]) -> np.ndarray:
+        if not texts or not self.n_rules:
+            return np.zeros((len(texts), self.n_rules), dtype=np.float32)
+        queries = np.stack([embed(t, self.dim) for t in texts])
+        return queries @ self.matrix.T
+
+    def rank(self, text: str, limit: int, min_score: float = 0.0) -> List[int]:
+        scores = self.score(text)
+        return top_k(np.where(scores >= min_score, scores, 0.0), limit)
+
+
+def fuse_scores(semantic: np.ndarray, keyword: Dict[int, int], semantic_weight: float,
+                min_score: float = 0.0) -> np.ndarray:
+    """Hybrid score: weighted sum of cosine similarity and max-normalized keyword score."""
+    fused = semantic_weight * np.where(semantic >= min_score, semantic, 0.0)
+    if keyword:
+        ids = np.fromiter(keyword.keys(), dtype=np.int64, count=len(keyword))
+        vals = np.fromiter(keyword.values(), dtype=np.float32, count=len(keyword))
+        if vals.max() > 0:
+            fused[ids] += (1.0 - semantic_weight) * np.clip(vals, 0, None) / vals.max()
+    return fused
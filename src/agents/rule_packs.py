@@ -0,0 +1,163 @@
+"""
+External rule packs for the knowledge base.
+
+Rule packs are JSON (or YAML, if PyYAML is installed) files in RULE_PACKS_DIR,
+keyed by state:
+
+    {
+      "LYRICS": [{"keywords": ["hook", "earworm"], "rule": "Keep the hook under 8 words."}],
+      "MELODY": [...]
+    }
+
+The loader stats the directory at most every RULE_PACKS_POLL_SECONDS and only
+re-reads/re-hashes files whose mtime or size changed. The compiled index is
+saved as plain JSON to RULE_CACHE_DIR, keyed by the hash of all inputs and of
+the code that builds it, so a restart with unchanged packs loads it instead of
+re-tokenizing everything.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import yaml
+except ImportError:  # YAML packs are optional
+    yaml = None
+
+PACK_EXTENSIONS = (".json", ".yaml", ".yml")
+
+
+def _read_pack(path: str, raw: bytes) -> Dict[str, List[Dict[str, Any]]]:
+    if path.endswith(".json"):
+        data = json.loads(raw.decode("utf-8"))
+    elif yaml is not None:
+        data = yaml.safe_load(raw.decode("utf-8"))
+    else:
+        print(f"Rule pack skipped (PyYAML not installed): {path}")
+        return {}
+
+    if not isinstance(data, dict):
+        raise ValueError(f"Rule pack must map state -> list of rules: {path}")
+
+    packs: Dict[str, List[Dict[str, Any]]] = {}
+    for state, rules in data.items():
+        clean = []
+        for r in rules or []:
+            if not isinstance(r, dict) or not r.get("rule"):
+                continue
+            clean.append({"keywords": [str(k) for k in r.get("keywords", [])], "rule": str(r["rule"])})
+        packs[str(state).upper().strip()] = clean
+    return packs
+
+
+class RulePackLoader:
+    """Tracks pack files by (mtime, size); re-reads only the files that changed."""
+
+    def __init__(self, packs_dir: str, poll_seconds: float = 2.0):
+        self.packs_dir = packs_dir
+        self.poll_seconds = poll_seconds
+        self._lock = threading.Lock()
+        self._last_poll = 0.0
+        # path -> (mtime_ns, size, sha256, rules_by_state)
+        self._files: Dict[str, Tuple[int, int, str, Dict[str, List[Dict[str, Any]]]]] = {}
+        self.reloads = 0
+
+    def _list_files(self) -> Dict[str, os.stat_result]:
+        if not os.path.isdir(self.packs_dir):
+            return {}
+        found = {}
+        with os.scandir(self.packs_dir) as it:
+            for entry in it:
+                if entry.is_file() and entry.name.lower().endswith(PACK_EXTENSIONS):
+                    found[entry.path] = entry.stat()
+        return found
+
+    def refresh(self, force: bool = False) -> bool:
+        """Stat the pack dir (throttled). Returns True if any pack was added/changed/removed."""
+        now = time.monotonic()
+        if not force and now - self._last_poll < self.poll_seconds:
+            return False
+
+        with self._lock:
+            self._last_poll = now
+            current = self._list_files()
+            changed = set(self._files) - set(current)  # removed
+            for path in changed:
+                del self._files[path]
+
+            for path, st in current.items():
+                old = self._files.get(path)
+                if old is not None and old[0] == st.st_mtime_ns and old[1] == st.st_size:
+                    continue
+                try:
+                    with open(path, "rb") as f:
+                        raw = f.read()
+                    rules = _read_pack(path, raw)
+                except Exception as e:
+                    print(f"Rule pack error in {path}: {e}")
+                    # remember this (mtime, size) so the error is reported once per edit;
+                    # the file keeps the rules of its last good version until it is fixed
+                    self._files[path] = (st.st_mtime_ns, st.st_size, old[2] if old else "", old[3] if old else {})
+                    continue
+                sha = hashlib.sha256(raw).hexdigest()
+                self._files[path] = (st.st_mtime_ns, st.st_size, sha, rules)
+                # touched but same content -> nothing to recompile
+                if old is None or old[2] != sha:
+                    changed.add(path)
+
+            if changed:
+                self.reloads += 1
+            return bool(changed)
+
+    def rules_by_state(self) -> Dict[str, List[Dict[str, Any]]]:
+        """All pack rules merged per state (files in name order)."""
+        with self._lock:
+            merged: Dict[str, List[Dict[str, Any]]] = {}
+            for path in sorted(self._files):
+                for state, rules in self._files[path][3].items():
+                    merged.setdefault(state, []).extend(rules)
+            return merged
+
+    def content_hash(self) -> str:
+        with self._lock:
+            h = hashlib.sha256()
+            for path in sorted(self._files):
+                h.update(os.path.basename(path).encode("utf-8"))
+                h.update(self._files[path][2].encode("ascii"))
+            return h.hexdigest()
+
+
+# ---------- compiled-index disk cache ----------
+def load_compiled(cache_dir: str, key: str) -> Optional[Dict[str, Any]]:
+    """The JSON data saved under `key`, or None if there is none (or it is unreadable)."""
+    path = os.path.join(cache_dir, f"rules_{key}.json")
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Rule cache unreadable, rebuilding: {e}")
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def save_compiled(cache_dir: str, key: str, data: Dict[str, Any]) -> None:
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        path = os.path.join(cache_dir, f"rules_{key}.json")
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp, path)
+
+        # keep only the current cache file (and drop pickles from older versions)
+        for name in os.listdir(cache_dir):
+            if name.startswith("rules_") and name.endswith((".json", ".pkl")) and name != os.path.basename(path):
+                os.remove(os.path.join(cache_dir, name))
+    except OSError as e:
+        print(f"Rule cache not saved: {e}")
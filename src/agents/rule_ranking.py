@@ -0,0 +1,98 @@
+"""
+BM25 rule ranking for the knowledge base.
+Rules (keywords + rule text) are precomputed into a sparse rules x terms
+BM25 weight matrix; scoring a query is one sparse dot product, and a batch
+of queries is one sparse matrix product.
+"""
+
+import re
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+from scipy import sparse
+
+from src.agents.rank_utils import top_k
+
+_TERM_RE = re.compile(r"[a-z']+")
+
+
+def _stem(term: str) -> str:
+    # tiny plural fold so "rhymes" meets "rhyme" (the keyword scorer's substring fallback does the same job)
+    if len(term) > 3 and term.endswith("s") and not term.endswith("ss"):
+        return term[:-1]
+    return term
+
+
+def terms_of(text: str) -> List[str]:
+    return [_stem(t) for t in _TERM_RE.findall((text or "").lower())]
+
+
+class BM25RuleRanker:
+    """BM25 over rule documents. Keywords are counted `keyword_boost` times (they are the curated signal)."""
+
+    def __init__(self, rules: Sequence[Dict[str, Any]], k1: float = 1.2, b: float = 0.75, keyword_boost: int = 2):
+        self.n_rules = len(rules)
+        self.vocab: Dict[str, int] = {}
+
+        rows, cols, tfs = [], [], []
+        doc_len = np.zeros(self.n_rules, dtype=np.float32)
+        for rid, rule in enumerate(rules):
+            counts: Dict[int, int] = {}
+            doc_terms = terms_of(rule.get("rule", ""))
+            for kw in rule.get("keywords", []):
+                doc_terms += terms_of(kw) * keyword_boost
+            for term in doc_terms:
+                col = self.vocab.setdefault(term, len(self.vocab))
+                counts[col] = counts.get(col, 0) + 1
+            doc_len[rid] = len(doc_terms)
+            for col, tf in counts.items():
+                rows.append(rid)
+                cols.append(col)
+                tfs.append(tf)
+
+        n_terms = len(self.vocab)
+        tf = sparse.csr_matrix(
+            (np.asarray(tfs, dtype=np.float32), (rows, cols)), shape=(self.n_rules, n_terms)
+        )
+
+        # idf per term (Lucene variant: log(1 + ...), never negative for very common terms)
+        df = np.bincount(np.asarray(cols, dtype=np.int64), minlength=n_terms).astype(np.float32)
+        idf = np.log1p((self.n_rules - df + 0.5) / (df + 0.5))
+
+        # tf saturation + length normalization, computed on the nonzeros only
+        avgdl = float(doc_len.mean()) if self.n_rules else 0.0
+        norm = k1 * (1 - b + b * (doc_len / avgdl)) if avgdl else np.full(self.n_rules, k1, dtype=np.float32)
+        tf_coo = tf.tocoo()
+        weights = idf[tf_coo.col] * (tf_coo.data * (k1 + 1)) / (tf_coo.data + norm[tf_coo.row])
+
+        # stored terms x rules (CSR) so a query just sums a few rows
+        self.weights_t = sparse.csr_matrix(
+            (weights.astype(np.float32), (tf_coo.col, tf_coo.row)), shape=(n_terms, self.n_rules)
+        )
+
+    def _query_vector(self, text: str) -> sparse.csr_matrix:
+        cols = sorted({self.vocab[t] for t in terms_of(text) if t in self.vocab})
+        data = np.ones(len(cols), dtype=np.float32)
+        return sparse.csr_matrix((data, ([0] * len(cols), cols)), shape=(1, len(self.vocab)))
+
+    def score(self, text: str) -> np.ndarray:
+        """BM25 score of every rule for one query (binary query term weights)."""
+        if not self.n_rules:
+            return np.zeros(0, dtype=np.float32)
+        return np.asarray((self._query_vector(text) @ self.weights_t).todense()).ravel()
+
+    def score_batch(self, texts: Sequence[str]) -> np.ndarray:
+        """(n_queries x n_rules) scores from one sparse matrix product."""
+        if not texts or not self.n_rules:
+            return np.zeros((len(texts), self.n_rules), dtype=np.float32)
+        q = sparse.vstack([self._query_vector(t) for t in texts], format="csr")
+        return np.asarray((q @ self.weights_t).todense())
+
+    top_k = staticmethod(top_k)
+
+    def rank(self, text: str, limit: int) -> List[int]:
+        return self.top_k(self.score(text), limit)
+
+    def rank_batch(self, texts: Sequence[str], limit: int) -> List[List[int]]:
+        matrix = self.score_batch(texts)
+        return [self.top_k(row, limit) for row in matrix]
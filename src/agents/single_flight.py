@@ -0,0 +1,94 @@
+"""
+Single-flight request coalescing for ECHO application.
+Concurrent callers with the same request fingerprint share one upstream call.
+Followers wait a bounded time: if the leader hangs, they make the call themselves.
+"""
+
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+class FlightTimeout(TimeoutError):
+    """The leader did not finish within the wait timeout (not an error of the call itself)."""
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+    def wait(self, timeout: Optional[float] = None) -> Any:
+        """Block until the leader finishes; returns its result or re-raises its error."""
+        if not self.done.wait(timeout):
+            raise FlightTimeout("single-flight: leader did not finish in time")
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class SingleFlight:
+    """
+    First caller for a key becomes the leader and does the work;
+    callers arriving while it runs wait for the leader's result, for at most
+    `wait_timeout` seconds (None = no limit).
+    """
+
+    def __init__(self, wait_timeout: Optional[float] = None):
+        self.wait_timeout = wait_timeout
+        self._lock = threading.Lock()
+        self._flights: Dict[str, _Flight] = {}
+        self.leaders = 0
+        self.shared = 0
+        self.timeouts = 0
+
+    def begin(self, key: str) -> Tuple[_Flight, bool]:
+        """Join the in-flight call for key, or start one. Returns (flight, is_leader)."""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                flight.waiters += 1
+                self.shared += 1
+                return flight, False
+            flight = _Flight()
+            self._flights[key] = flight
+            self.leaders += 1
+            return flight, True
+
+    def finish(self, key: str, flight: _Flight, result: Any = None, error: Optional[BaseException] = None) -> None:
+        """Leader publishes its outcome and wakes the waiters."""
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        flight.result = result
+        flight.error = error
+        flight.done.set()
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Run fn() once per key at a time. Returns (result, was_shared)."""
+        flight, leader = self.begin(key)
+        if not leader:
+            try:
+                return flight.wait(self.wait_timeout), True
+            except FlightTimeout:
+                self.timed_out()
+                return fn(), False  # the leader is stuck: don't wait on it any longer
+
+        try:
+            result = fn()
+        except BaseException as e:
+            self.finish(key, flight, error=e)
+            raise
+        self.finish(key, flight, result=result)
+        return result, False
+
+    def timed_out(self) -> None:
+        """A follower gave up waiting (FlightTimeout) and is calling upstream itself."""
+        with self._lock:
+            self.timeouts += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"leaders": self.leaders, "shared": self.shared, "timeouts": self.timeouts,
+                    "in_flight": len(self._flights)}
@@ -3,6 +3,8 @@ Configuration constants for ECHO application.
 UI colors, settings, and constants.
 """
 
+import os
+
 # Color Palette (Soft Pastel Blues)
 COLORS = {
     "primary_blue": "#42A5F5",
@@ -69,6 +71,93 @@ AUDIO_SAMPLES_DIR = "assets/audio/genre_samples"
 
 # LLM Configuration
 LLM_MODEL = "gemini-1.5-flash"
+GEMINI_MODEL = "gemini-2.0-flash"
+
+# Shared Gemini client (one per process, see src/agents/registry.py)
+GEMINI_MAX_CONCURRENT_REQUESTS = 16
+
+# LLM backend: "gemini" (real API) or "fake" (local stand-in for load tests, see src/agents/llm_backends.py)
+LLM_BACKEND = os.getenv("ECHO_LLM_BACKEND", "gemini")
+FAKE_LLM_LATENCY_MS = float(os.getenv("ECHO_FAKE_LLM_LATENCY_MS", "400"))
+FAKE_LLM_LATENCY_DIST = os.getenv("ECHO_FAKE_LLM_LATENCY_DIST", "lognormal")  # fixed / uniform / lognormal
+FAKE_LLM_TTFT_MS = float(os.getenv("ECHO_FAKE_LLM_TTFT_MS", "150"))
+FAKE_LLM_ERROR_RATE = float(os.getenv("ECHO_FAKE_LLM_ERROR_RATE", "0"))
+FAKE_LLM_RESPONSE_WORDS = int(os.getenv("ECHO_FAKE_LLM_RESPONSE_WORDS", "40"))
+FAKE_LLM_SEED = int(os.getenv("ECHO_FAKE_LLM_SEED", "0"))
+
+# LLM response cache (see src/agents/response_cache.py)
+LLM_CACHE_ENABLED = True
+LLM_CACHE_MAX_ENTRIES = 512
+LLM_CACHE_TTL_SECONDS = 60 * 60
+# set to a file path to keep cached answers across restarts (None = memory only)
+LLM_CACHE_SQLITE_PATH = os.getenv("ECHO_LLM_CACHE_DB") or None
+
+# Gemini rate limit / retries / circuit breaker (per API key, see src/agents/resilience.py)
+GEMINI_RATE_LIMIT_PER_SEC = 10
+GEMINI_RATE_LIMIT_BURST = 20
+GEMINI_RETRY_ATTEMPTS = 3
+GEMINI_RETRY_BASE_DELAY = 0.5
+GEMINI_RETRY_MAX_DELAY = 8.0
+GEMINI_BREAKER_FAILURES = 5
+GEMINI_BREAKER_COOLDOWN = 30.0
+GEMINI_FALLBACK_MESSAGE = "The AI assistant is busy right now — please try again in a moment."
+# callers sharing an identical in-flight request (see src/agents/single_flight.py) wait at most this
+# long for it, then call upstream themselves; roughly one request incl. retries (google-genai 0.3.0
+# sets no HTTP timeout of its own, so a hung call would otherwise block them forever)
+SINGLE_FLIGHT_WAIT_SECONDS = float(os.getenv("ECHO_SINGLE_FLIGHT_WAIT_SECONDS", "60"))
+
+# Max estimated input tokens per chat turn (see src/utils/prompt_builder.py)
+PROMPT_TOKEN_BUDGET = 1500
+
+# Guide-rule ranking in src/agents/knowledge_base.py: "keyword" (hand-tuned +3/+2/+1), "bm25",
+# "semantic" (offline hashed n-gram embeddings) or "hybrid" (semantic + keyword)
+RULES_RANKING_MODE = "keyword"
+RULE_EMBED_DIM = 512
+RULES_SEMANTIC_MIN_SCORE = 0.12      # cosine below this does not count as a match
+RULES_HYBRID_SEMANTIC_WEIGHT = 0.5   # hybrid = w * cosine + (1 - w) * normalized keyword score
+RULES_MEMO_MAX_ENTRIES = 256        # memoized retrieve_rules / format_rules_for_prompt results
+
+# External rule packs (JSON/YAML keyed by state) merged into the built-in guide rules.
+# The dir is re-checked at most every RULE_PACKS_POLL_SECONDS; edits are picked up without a restart.
+_PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+RULE_PACKS_DIR = os.getenv("ECHO_RULE_PACKS_DIR") or os.path.join(_PROJECT_ROOT, "data", "rule_packs")
+RULE_PACKS_POLL_SECONDS = 2.0
+# compiled rule index is cached here as JSON, keyed by a hash of the built-in rules + pack files + code
+RULE_CACHE_DIR = os.getenv("ECHO_RULE_CACHE_DIR") or os.path.join(_PROJECT_ROOT, "data", ".rule_cache")
+
+# Chat history compaction (see src/utils/chat_summary.py)
+CHAT_COMPACT_MAX_TURNS = 12      # fold older turns once history is longer than this...
+CHAT_COMPACT_MAX_TOKENS = 1200   # ...or bigger than this (estimated tokens)
+CHAT_KEEP_RECENT_TURNS = 6       # raw turns kept after folding
+CHAT_SUMMARY_MAX_LINES = 12      # rolling summary size
+
+# Drafts storage (see src/storage/backends.py): "json" (data/drafts.json), "sqlite" (data/drafts.db)
+# or "journal" (append-only data/drafts.journal); drafts.json is imported on first use
+DRAFTS_BACKEND = os.getenv("ECHO_DRAFTS_BACKEND", "json")
+# drafts.json write lock shared by all workers: None = wait in the OS lock queue,
+# a number = poll with backoff and raise LockTimeout after that many seconds
+DRAFTS_LOCK_TIMEOUT = None
+# parsed drafts.json is cached per process; the file is stat'ed for changes by other workers
+# at most this often (our own saves update the cache immediately)
+DRAFTS_CACHE_CHECK_SECONDS = 1.0
+# journal backend: fsync every append; compact once dead records reach both limits
+DRAFTS_JOURNAL_FSYNC = True
+DRAFTS_JOURNAL_COMPACT_MIN_DEAD = 500
+DRAFTS_JOURNAL_COMPACT_RATIO = 0.5   # dead / all records
+DRAFTS_JOURNAL_MAX_PATCHES = 32      # delta saves per draft before a full record is written again
+
+# Autosave (see src/storage/autosave.py): edits are saved in the background once the song
+# has been idle this long, and at the latest this long after the first unsaved change
+AUTOSAVE_ENABLED = os.getenv("ECHO_AUTOSAVE", "1") != "0"
+AUTOSAVE_DEBOUNCE_SECONDS = 2.0
+AUTOSAVE_MAX_WAIT_SECONDS = 10.0
+AUTOSAVE_MAX_PENDING = 256   # queued drafts before submit() waits for the writer
+
+# Keep every saved version of each draft in data/draft_history.db (lines stored once by content hash)
+DRAFTS_HISTORY_ENABLED = os.getenv("ECHO_DRAFTS_HISTORY", "1") != "0"
+
+# Drafts sidebar: drafts shown per page (the search box covers names, intents and lyrics)
+DRAFTS_SIDEBAR_PAGE_SIZE = 20
 
 # Default Song Values
 DEFAULT_SONG_TITLE = "DRAFT"
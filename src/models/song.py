@@ -2,13 +2,26 @@
 Song data model for ECHO application.
 """
 
-from typing import List, Optional
+from typing import Any, Dict, List, Optional, Set
+
+# fields saved with a draft; assigning one of them marks it dirty
+TRACKED_FIELDS = ("title", "intent", "lyrics", "melody_description", "genre", "sub_genre")
 
 
 class Song:
-    """Represents a song draft with lyrics, melody, and metadata."""
+    """
+    Represents a song draft with lyrics, melody, and metadata.
+
+    Changes are tracked for delta saves: `version` goes up on every change,
+    `dirty_fields` holds the fields assigned since the last `mark_clean()`, and
+    lyric line edits made through add/replace/remove_lyric_line are recorded in
+    `line_changes`. `saved_rev` is the store's revision (content hash) of the
+    draft these changes apply to; the store rejects a delta on any other one. Editing `song.lyrics` in place (e.g. `.append`) is not
+    tracked; assigning a new list is (the whole lyrics list is then saved).
+    """
     
     def __init__(self, title: str = "Draft", intent: Optional[str] = None):
+        self._tracking = False
         self.title = title
         self.intent = intent  # Initial creation intent from user
         self.lyrics: List[str] = []  # List of lyric lines
@@ -17,31 +30,77 @@ class Song:
         self.sub_genre: Optional[str] = None
         self.audio_path: Optional[str] = None  # Path to generated MP3
         self.generated: bool = False  # Whether music has been generated
+
+        self.version = 0
+        self.saved_version: Optional[int] = None  # version last written to the store
+        self.saved_rev: Optional[str] = None  # stored draft revision the recorded changes are based on
+        self.dirty_fields: Set[str] = set()
+        self.line_changes: List[Dict[str, Any]] = []  # {"op": insert|replace|delete, "index", "line"}
+        self._tracking = True
+
+    def __setattr__(self, name: str, value: Any):
+        if name in TRACKED_FIELDS and self.__dict__.get("_tracking"):
+            if name == "lyrics" or self.__dict__.get(name) != value:
+                self.__dict__["version"] += 1
+                self.dirty_fields.add(name)
+                if name == "lyrics":
+                    self.line_changes.clear()  # whole list replaced: line records no longer apply
+        object.__setattr__(self, name, value)
+
+    def _record_line_change(self, op: str, index: int, line: Optional[str] = None):
+        self.version += 1
+        if "lyrics" not in self.dirty_fields:
+            self.line_changes.append({"op": op, "index": index, "line": line})
+
+    @property
+    def is_dirty(self) -> bool:
+        """True if something changed since the last save (or the song was never saved)."""
+        return self.saved_version is None or bool(self.dirty_fields or self.line_changes)
+
+    def mark_clean(self):
+        """Call after the song was saved (or loaded): forget recorded changes."""
+        self.dirty_fields.clear()
+        self.line_changes.clear()
+        self.saved_version = self.version
+
+    def delta(self) -> Dict[str, Any]:
+        """Changes since the last mark_clean(): changed field values + lyric line ops."""
+        return {
+            "base_rev": self.saved_rev,
+            "version": self.version,
+            "fields": {name: getattr(self, name) for name in sorted(self.dirty_fields)},
+            "line_changes": [dict(c) for c in self.line_changes],
+        }
         
     def add_lyric_line(self, line: str, index: Optional[int] = None):
         """Add a lyric line. If index is provided, insert at that position."""
         if index is not None:
+            # record the position list.insert really used
+            pos = max(0, min(index if index >= 0 else len(self.lyrics) + index, len(self.lyrics)))
             self.lyrics.insert(index, line)
         else:
+            pos = len(self.lyrics)
             self.lyrics.append(line)
+        self._record_line_change("insert", pos, line)
     
     def replace_lyric_line(self, old_index: int, new_line: str):
         """Replace a lyric line at the given index."""
         if 0 <= old_index < len(self.lyrics):
             self.lyrics[old_index] = new_line
+            self._record_line_change("replace", old_index, new_line)
     
     def remove_lyric_line(self, index: int):
         """Remove a lyric line at the given index."""
         if 0 <= index < len(self.lyrics):
             self.lyrics.pop(index)
+            self._record_line_change("delete", index)
     
     def has_melody(self) -> bool:
         """Check if melody description exists."""
         return bool(self.melody_description.strip())
 
     def delete_lyric_line(self, index: int):
-        if 0 <= index < len(self.lyrics):
-            self.lyrics.pop(index)
+        self.remove_lyric_line(index)
 
     def to_dict(self):
         """Convert song to dictionary for easy serialization."""
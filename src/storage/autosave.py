@@ -0,0 +1,247 @@
+"""
+Debounced background autosave for ECHO drafts.
+The UI thread only snapshots the song and queues it; one writer thread per
+process saves it (as a delta when possible, see drafts_store.save_draft_delta).
+Repeated saves of the same draft within the debounce window are coalesced
+into one write. Pending saves are flushed at interpreter exit.
+"""
+
+import atexit
+import copy
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from src.agents.metrics import Histogram, LATENCY_BUCKETS
+from src.config.settings import (
+    AUTOSAVE_DEBOUNCE_SECONDS, AUTOSAVE_MAX_WAIT_SECONDS, AUTOSAVE_MAX_PENDING
+)
+from src.models.song import Song
+from src.storage import drafts_store
+from src.storage.backends import song_rev
+
+
+class _Pending:
+    __slots__ = ("draft_id", "snapshot", "live", "due", "deadline", "queued_at")
+
+    def __init__(self, draft_id: str, snapshot: Song, live: Song, due: float, deadline: float):
+        self.draft_id = draft_id
+        self.snapshot = snapshot  # private copy, incl. the changes recorded since the last save
+        self.live = live
+        self.due = due
+        self.deadline = deadline  # debounce never pushes a save past this
+        self.queued_at = time.monotonic()
+
+
+def _merge_into(newer: Song, older: Song) -> None:
+    """Make `newer`'s recorded changes cover everything since `older`'s last save."""
+    if newer.saved_version is None:
+        return  # newer is saved in full anyway (e.g. a restored version)
+    newer.saved_version = older.saved_version
+    newer.saved_rev = older.saved_rev
+    newer.dirty_fields |= older.dirty_fields
+    if "lyrics" in newer.dirty_fields:
+        newer.line_changes = []  # the whole lyrics list gets written
+    else:
+        newer.line_changes = older.line_changes + newer.line_changes
+
+
+class AutosaveWriter:
+    """Bounded, per-draft-coalescing save queue drained by one daemon thread."""
+
+    def __init__(self, debounce_seconds: float = 2.0, max_wait_seconds: float = 10.0, max_pending: int = 256):
+        self.debounce_seconds = debounce_seconds
+        self.max_wait_seconds = max_wait_seconds
+        self.max_pending = max_pending
+
+        self._cond = threading.Condition()
+        self._pending: "OrderedDict[str, _Pending]" = OrderedDict()
+        self._writing: Dict[str, _Pending] = {}
+        self._failed: Dict[str, str] = {}  # draft id -> error of its last write, until one succeeds
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+
+        self.latency = Histogram(LATENCY_BUCKETS)  # seconds per write
+        self.queue_wait = Histogram(LATENCY_BUCKETS)  # first submit -> write start
+        self.submitted = 0
+        self.coalesced = 0
+        self.writes = 0
+        self.errors = 0
+        self.backpressure_waits = 0
+        self.last_error: Optional[str] = None
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="drafts-autosave", daemon=True)
+            self._thread.start()
+
+    def submit(self, song: Song, draft_id: Optional[str] = None, immediate: bool = False) -> str:
+        """
+        Queue a save of `song` and return its draft id (a new one for unsaved songs).
+        The song is marked clean right away; its changes travel with the queued copy.
+        """
+        if draft_id and not song.is_dirty:
+            if immediate:
+                self._expedite(draft_id)
+            return draft_id
+        draft_id = draft_id or str(uuid.uuid4())
+        snapshot = copy.deepcopy(song)
+        song.mark_clean()
+        # the queued write stores exactly the snapshot: later changes are based on that revision
+        song.saved_rev = song_rev(drafts_store.song_to_dict(snapshot))
+
+        now = time.monotonic()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("autosave writer is closed")
+            while draft_id not in self._pending and len(self._pending) >= self.max_pending:
+                self.backpressure_waits += 1
+                self._cond.wait(timeout=0.5)
+
+            self.submitted += 1
+            old = self._pending.get(draft_id)
+            if old is not None:
+                self.coalesced += 1
+                _merge_into(snapshot, old.snapshot)
+                old.snapshot, old.live = snapshot, song
+                old.due = now if immediate else min(now + self.debounce_seconds, old.deadline)
+            else:
+                due = now if immediate else now + self.debounce_seconds
+                self._pending[draft_id] = _Pending(draft_id, snapshot, song, due, now + self.max_wait_seconds)
+            self._ensure_thread()
+            self._cond.notify_all()
+        return draft_id
+
+    def _expedite(self, draft_id: str) -> None:
+        with self._cond:
+            item = self._pending.get(draft_id)
+            if item is not None:
+                item.due = time.monotonic()
+                self._cond.notify_all()
+
+    def latest(self, draft_id: str) -> Optional[Song]:
+        """
+        The newest queued or in-flight version of a draft (None if nothing is
+        waiting), so reopening a draft never shows the older stored copy.
+        """
+        with self._cond:
+            item = self._pending.get(draft_id) or self._writing.get(draft_id)
+            if item is None:
+                return None
+            # loaded like a stored draft (clean at this version): the queued write stores exactly it
+            return drafts_store.dict_to_song(drafts_store.song_to_dict(item.snapshot))
+
+    def cancel(self, draft_id: str) -> bool:
+        """Drop a queued (not yet started) save, e.g. before deleting the draft."""
+        with self._cond:
+            dropped = self._pending.pop(draft_id, None) is not None
+            self._cond.notify_all()
+            return dropped
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Write everything queued now and wait for it. Returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            now = time.monotonic()
+            for item in self._pending.values():
+                item.due = now
+            self._cond.notify_all()
+            while self._pending or self._writing:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(timeout=remaining)
+            return True
+
+    def close(self, timeout: Optional[float] = 10.0) -> None:
+        self.flush(timeout=timeout)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def _next_due(self) -> Optional[_Pending]:
+        now = time.monotonic()
+        item = min(self._pending.values(), key=lambda p: p.due, default=None)
+        return item if item is not None and item.due <= now else None
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                item = self._next_due()
+                while item is None:
+                    if self._closed and not self._pending:
+                        return
+                    soonest = min((p.due for p in self._pending.values()), default=None)
+                    self._cond.wait(timeout=None if soonest is None else max(0.0, soonest - time.monotonic()))
+                    item = self._next_due()
+                del self._pending[item.draft_id]
+                self._writing[item.draft_id] = item
+
+            start = time.monotonic()
+            error = None
+            try:
+                drafts_store.save_draft_delta(item.snapshot, item.draft_id)
+            except Exception as e:
+                error = e
+                # changes were handed to us; make the next save of the live song a full one
+                item.live.saved_version = None
+                print(f"Autosave of draft {item.draft_id} failed: {e}")
+            elapsed = time.monotonic() - start
+
+            with self._cond:
+                self._writing.pop(item.draft_id, None)
+                self.queue_wait.observe(start - item.queued_at)
+                if error is None:
+                    self.writes += 1
+                    self.latency.observe(elapsed)
+                    self._failed.pop(item.draft_id, None)
+                else:
+                    self.errors += 1
+                    self.last_error = f"{type(error).__name__}: {error}"
+                    self._failed[item.draft_id] = self.last_error
+                self._cond.notify_all()
+
+    def status(self, draft_id: Optional[str]) -> Dict[str, Any]:
+        """For the UI: {"pending": a save is queued or being written, "error": why the last write failed}."""
+        with self._cond:
+            return {
+                "pending": draft_id in self._pending or draft_id in self._writing,
+                "error": self._failed.get(draft_id),
+            }
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "queue_depth": len(self._pending),
+                "in_flight": len(self._writing),
+                "submitted": self.submitted,
+                "coalesced": self.coalesced,
+                "writes": self.writes,
+                "errors": self.errors,
+                "backpressure_waits": self.backpressure_waits,
+                "write_p50_s": self.latency.quantile(0.50),
+                "write_p95_s": self.latency.quantile(0.95),
+                "queue_wait_p95_s": self.queue_wait.quantile(0.95),
+                "last_error": self.last_error,
+            }
+
+
+_autosaver: Optional[AutosaveWriter] = None
+_autosaver_lock = threading.Lock()
+
+
+def get_autosaver() -> AutosaveWriter:
+    """Process-wide autosave writer (built from settings on first use, flushed at exit)."""
+    global _autosaver
+    if _autosaver is None:
+        with _autosaver_lock:
+            if _autosaver is None:
+                _autosaver = AutosaveWriter(
+                    debounce_seconds=AUTOSAVE_DEBOUNCE_SECONDS,
+                    max_wait_seconds=AUTOSAVE_MAX_WAIT_SECONDS,
+                    max_pending=AUTOSAVE_MAX_PENDING,
+                )
+                atexit.register(_autosaver.close)
+    return _autosaver
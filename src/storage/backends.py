@@ -0,0 +1,264 @@
+"""
+Storage backends for ECHO drafts.
+drafts_store talks to a DraftsBackend; which one is picked by DRAFTS_BACKEND in settings:
+- "json":   every draft in one data/drafts.json (the original format)
+- "sqlite": one row per draft in data/drafts.db (see src/storage/sqlite_backend.py)
+
+A draft payload is {"id", "name", "updated_at", "song"}; lists are newest first.
+"""
+
+import copy
+import hashlib
+import json
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Set
+
+from src.storage.file_lock import FileLock, atomic_write_text, with_retries
+
+
+class DraftsBackend(ABC):
+    """Interface every drafts backend implements."""
+
+    name = "base"
+
+    @abstractmethod
+    def load_all(self) -> List[Dict[str, Any]]:
+        """All drafts, newest first."""
+
+    @abstractmethod
+    def get(self, draft_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def upsert(self, payload: Dict[str, Any]) -> None:
+        """Replace the draft with payload["id"] in place, or add it as the newest one."""
+
+    @abstractmethod
+    def delete(self, draft_id: str) -> None:
+        ...
+
+    @abstractmethod
+    def names(self, prefix: str = "") -> Set[str]:
+        """Upper-cased draft names starting with `prefix` (case-insensitive)."""
+
+    def apply_delta(self, draft_id: str, delta: Dict[str, Any], name: str, updated_at: str) -> bool:
+        """
+        Apply a Song.delta() to a stored draft. Returns False (caller does a full
+        save) if the draft is missing, its content is not the revision the delta
+        was made on (see song_rev), or the delta doesn't replay on it.
+        Backends override this to check and write atomically.
+        """
+        current = self.get(draft_id)
+        song = rebase_song_delta(current, delta)
+        if song is None:
+            return False
+        self.upsert({**current, "name": name, "updated_at": updated_at, "song": song})
+        return True
+
+    def change_token(self) -> Any:
+        """
+        Opaque value that changes whenever the stored drafts may have changed
+        (used to keep the search index in sync). None = can't tell.
+        """
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name}
+
+
+def song_rev(song: Dict[str, Any]) -> str:
+    """Revision of a stored song: a hash of its saved content (Song.version is per session, not used)."""
+    content = [
+        song.get("title") or "", song.get("intent") or "", [str(l) for l in song.get("lyrics") or []],
+        song.get("melody_description") or "", song.get("genre") or "", song.get("sub_genre") or "",
+    ]
+    return hashlib.blake2b(json.dumps(content, ensure_ascii=False).encode("utf-8"), digest_size=16).hexdigest()
+
+
+def rebase_song_delta(current: Optional[Dict[str, Any]], delta: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """The stored draft's song with `delta` applied, or None if it isn't the delta's base revision."""
+    if current is None or not delta.get("base_rev"):
+        return None
+    song = current.get("song") or {}
+    if song_rev(song) != delta["base_rev"]:
+        return None
+    try:
+        return apply_song_delta(song, delta)
+    except (IndexError, KeyError, TypeError):
+        return None
+
+
+def apply_song_delta(song: Dict[str, Any], delta: Dict[str, Any]) -> Dict[str, Any]:
+    """New song dict = `song` + changed fields + replayed lyric line changes (see Song.delta)."""
+    out = dict(song)
+    fields = delta.get("fields") or {}
+    if "lyrics" in fields:
+        lyrics = list(fields["lyrics"] or [])
+    else:
+        lyrics = list(out.get("lyrics") or [])
+        for change in delta.get("line_changes") or []:
+            op, i = change["op"], change["index"]
+            if op == "insert":
+                lyrics.insert(i, change["line"])
+            elif op == "replace":
+                lyrics[i] = change["line"]
+            elif op == "delete":
+                lyrics.pop(i)
+    out.update({k: v for k, v in fields.items() if k != "lyrics"})
+    out["lyrics"] = lyrics
+    out["version"] = delta.get("version", 0)
+    return out
+
+
+class JsonDraftsBackend(DraftsBackend):
+    """
+    All drafts in one JSON list; every write rewrites the whole file.
+    Writes are atomic (temp file + fsync + os.replace) and each
+    read-modify-write holds an inter-process lock on "<path>.lock".
+
+    The parsed list is cached for the whole process. It is re-read only when
+    the file's (inode, mtime, size) changed (os.replace gives every write a
+    new inode), checked at most every `cache_check_seconds`; our own writes
+    refresh the cache directly.
+    """
+
+    name = "json"
+
+    def __init__(self, path: str, lock_timeout: Optional[float] = None, cache_check_seconds: float = 1.0):
+        self.path = path
+        self.lock_timeout = lock_timeout
+        self.cache_check_seconds = cache_check_seconds
+
+        self._cache_lock = threading.Lock()
+        self._cached: Optional[List[Dict[str, Any]]] = None  # never mutated in place, never handed out
+        self._cached_token = None
+        self._checked_at = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def _lock(self) -> FileLock:
+        return FileLock(self.path + ".lock", timeout=self.lock_timeout)
+
+    def _ensure_file(self) -> None:
+        if os.path.exists(self.path):
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with self._lock():
+            if not os.path.exists(self.path):
+                self._write([])
+
+    def _write(self, drafts: List[Dict[str, Any]]) -> None:
+        atomic_write_text(self.path, json.dumps(drafts, ensure_ascii=False, indent=2))
+
+    @staticmethod
+    def _token(st: os.stat_result):
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    def _read(self):
+        """(drafts, token) read from one open file, so the token matches the content."""
+        with open(self.path, "r", encoding="utf-8") as f:
+            token = self._token(os.fstat(f.fileno()))
+            return json.load(f) or [], token
+
+    def _remember(self, drafts: List[Dict[str, Any]], token) -> None:
+        with self._cache_lock:
+            self._cached, self._cached_token = drafts, token
+            self._checked_at = time.monotonic()
+
+    def _cached_if(self, token) -> Optional[List[Dict[str, Any]]]:
+        with self._cache_lock:
+            if self._cached is not None and token == self._cached_token:
+                self._checked_at = time.monotonic()
+                self.cache_hits += 1
+                return self._cached
+            self.cache_misses += 1
+            return None
+
+    def _current(self) -> List[Dict[str, Any]]:
+        with self._cache_lock:
+            if self._cached is not None and time.monotonic() - self._checked_at < self.cache_check_seconds:
+                self.cache_hits += 1
+                return self._cached
+
+        self._ensure_file()
+        drafts = self._cached_if(with_retries(lambda: self._token(os.stat(self.path))))
+        if drafts is None:
+            # no lock needed: the file is only ever replaced whole
+            drafts, token = with_retries(self._read)
+            self._remember(drafts, token)
+        return drafts
+
+    def _fresh_locked(self) -> List[Dict[str, Any]]:
+        """Current drafts while holding the write lock (cache if the file is unchanged)."""
+        drafts = self._cached_if(self._token(os.stat(self.path)))
+        return drafts if drafts is not None else self._read()[0]
+
+    def load_all(self) -> List[Dict[str, Any]]:
+        # deep copies: callers may edit the drafts (incl. song/lyrics) without touching the cache
+        return copy.deepcopy(self._current())
+
+    def get(self, draft_id: str) -> Optional[Dict[str, Any]]:
+        found = next((d for d in self._current() if d.get("id") == draft_id), None)
+        return copy.deepcopy(found) if found is not None else None
+
+    def upsert(self, payload: Dict[str, Any]) -> None:
+        payload = copy.deepcopy(payload)  # the cache keeps its own copy, not the caller's objects
+        self._ensure_file()
+        with self._lock():
+            drafts = list(self._fresh_locked())
+            for i, d in enumerate(drafts):
+                if d.get("id") == payload["id"]:
+                    drafts[i] = payload
+                    break
+            else:
+                drafts.insert(0, payload)  # newest first
+            self._write(drafts)
+            self._remember(drafts, self._token(os.stat(self.path)))
+
+    def delete(self, draft_id: str) -> None:
+        self._ensure_file()
+        with self._lock():
+            drafts = [d for d in self._fresh_locked() if d.get("id") != draft_id]
+            self._write(drafts)
+            self._remember(drafts, self._token(os.stat(self.path)))
+
+    def apply_delta(self, draft_id: str, delta: Dict[str, Any], name: str, updated_at: str) -> bool:
+        self._ensure_file()
+        with self._lock():  # check and write in one read-modify-write
+            drafts = list(self._fresh_locked())
+            for i, d in enumerate(drafts):
+                if d.get("id") == draft_id:
+                    break
+            else:
+                return False
+            song = rebase_song_delta(d, delta)
+            if song is None:
+                return False
+            drafts[i] = {**d, "name": name, "updated_at": updated_at, "song": song}
+            self._write(drafts)
+            self._remember(drafts, self._token(os.stat(self.path)))
+        return True
+
+    def names(self, prefix: str = "") -> Set[str]:
+        prefix = prefix.upper()
+        found = {(d.get("name") or "").strip().upper() for d in self._current()}
+        return {n for n in found if n.startswith(prefix)}
+
+    def change_token(self) -> Any:
+        # always a fresh stat (the cache may be up to cache_check_seconds behind other workers)
+        self._ensure_file()
+        return with_retries(lambda: self._token(os.stat(self.path)))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cache_lock:
+            total = self.cache_hits + self.cache_misses
+            return {
+                "backend": self.name,
+                "cache_hits": self.cache_hits,
+                "cache_misses": self.cache_misses,
+                "hit_rate": round(self.cache_hits / total, 3) if total else 0.0,
+                "cached_drafts": len(self._cached) if self._cached is not None else 0,
+            }
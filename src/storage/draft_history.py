@@ -0,0 +1,227 @@
+"""
+Version history for ECHO drafts (data/draft_history.db).
+Every save records a version of the draft, but text is stored by content:
+each lyric line and the melody description is hashed and kept once in a
+`chunks` table, and a version is the list of its line hashes plus the small
+scalar fields. The hash list itself is stored as the edits against the
+previous version (a full list every KEYFRAME_EVERY versions, so rebuilding one
+replays a bounded chain). Re-saving a song after editing one line therefore
+adds one chunk and one small edit record, not another copy of the song, and a
+save that changed nothing adds no version at all.
+
+History is kept when a draft is deleted, so deleted drafts can be restored.
+"""
+
+import difflib
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS chunks (hash TEXT PRIMARY KEY, text TEXT NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS versions ("
+    "draft_id TEXT NOT NULL, "
+    "version_no INTEGER NOT NULL, "
+    "created_at TEXT NOT NULL, "
+    "digest TEXT NOT NULL, "  # hash of the whole snapshot: skips saves that changed nothing
+    "fields TEXT NOT NULL, "  # JSON: title, intent, genre, sub_genre, version
+    "lyrics TEXT NOT NULL, "  # JSON: list of line hashes, or {"ops": [[start, end, [hashes]], ...]} on the previous
+    "line_count INTEGER NOT NULL, "
+    "melody TEXT NOT NULL, "  # hash of melody_description
+    "size INTEGER NOT NULL, "  # bytes a full copy of this snapshot would take
+    "PRIMARY KEY (draft_id, version_no))",
+)
+
+# song fields stored inline with each version (text fields go to chunks)
+_SCALAR_FIELDS = ("title", "intent", "genre", "sub_genre", "version")
+KEYFRAME_EVERY = 16
+
+
+def chunk_hash(text: str) -> str:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _hash_ops(old: List[str], new: List[str]) -> List[List[Any]]:
+    """Edits turning `old` into `new`: [start, end, replacement hashes] on `old`, in order."""
+    return [
+        [i1, i2, new[j1:j2]]
+        for op, i1, i2, j1, j2 in difflib.SequenceMatcher(None, old, new, autojunk=False).get_opcodes()
+        if op != "equal"
+    ]
+
+
+class DraftHistory:
+    """Content-addressed version store; safe to share between threads and worker processes."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._last: Dict[str, Any] = {}  # draft id -> (version_no, line hashes) of its latest version
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=10.0, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        for stmt in _SCHEMA:
+            self._db.execute(stmt)
+
+    def record(self, draft_id: str, song: Dict[str, Any], created_at: Optional[str] = None) -> Optional[int]:
+        """Store `song` (a drafts_store.song_to_dict) as the next version. None if it equals the latest one."""
+        lines = [str(l) for l in song.get("lyrics") or []]
+        melody = song.get("melody_description") or ""
+        fields = {k: song.get(k) for k in _SCALAR_FIELDS}
+        line_hashes = [chunk_hash(l) for l in lines]
+        melody_hash = chunk_hash(melody)
+        digest = chunk_hash(json.dumps([{k: v for k, v in fields.items() if k != "version"},
+                                        line_hashes, melody_hash], ensure_ascii=False, sort_keys=True))
+        size = len(json.dumps(song, ensure_ascii=False).encode("utf-8"))
+        created_at = created_at or datetime.utcnow().isoformat(timespec="seconds") + "Z"
+
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")  # version numbers are assigned under the write lock
+            try:
+                last = self._db.execute(
+                    "SELECT version_no, digest FROM versions WHERE draft_id = ? ORDER BY version_no DESC LIMIT 1",
+                    (draft_id,),
+                ).fetchone()
+                if last is not None and last[1] == digest:
+                    self._db.execute("COMMIT")
+                    return None
+                self._db.executemany(
+                    "INSERT OR IGNORE INTO chunks (hash, text) VALUES (?, ?)",
+                    set(zip(line_hashes, lines)) | {(melody_hash, melody)},
+                )
+                version_no = (last[0] if last else 0) + 1
+                lyrics = line_hashes
+                if version_no % KEYFRAME_EVERY != 1:
+                    ops = _hash_ops(self._line_hashes(draft_id, last[0]), line_hashes)
+                    if sum(len(op[2]) + 1 for op in ops) < len(line_hashes):
+                        lyrics = {"ops": ops}
+                self._db.execute(
+                    "INSERT INTO versions (draft_id, version_no, created_at, digest, fields, lyrics, line_count, "
+                    "melody, size) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (draft_id, version_no, created_at, digest, json.dumps(fields, ensure_ascii=False),
+                     json.dumps(lyrics, separators=(",", ":")), len(line_hashes), melody_hash, size),
+                )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                self._last.pop(draft_id, None)
+                raise
+            self._last[draft_id] = (version_no, line_hashes)
+        return version_no
+
+    def _line_hashes(self, draft_id: str, version_no: int) -> List[str]:
+        """Line hashes of a version: its keyframe with the later edit records replayed."""
+        cached = self._last.get(draft_id)
+        if cached is not None and cached[0] == version_no:
+            return list(cached[1])
+        rows = self._db.execute(
+            "SELECT lyrics FROM versions WHERE draft_id = ? AND version_no <= ? "
+            "ORDER BY version_no DESC LIMIT ?",
+            (draft_id, version_no, KEYFRAME_EVERY),
+        ).fetchall()
+        chain = []
+        for (raw,) in rows:
+            rec = json.loads(raw)
+            if isinstance(rec, list):
+                hashes = rec
+                break
+            chain.append(rec["ops"])
+        else:
+            raise ValueError(f"No keyframe for version {version_no} of draft {draft_id}")
+        for ops in reversed(chain):
+            for start, end, new in reversed(ops):  # back to front: earlier indexes stay valid
+                hashes[start:end] = new
+        return hashes
+
+    def list_versions(self, draft_id: str) -> List[Dict[str, Any]]:
+        """Versions of a draft, newest first: {"version_no", "created_at", "title", "lines"}."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT version_no, created_at, fields, line_count FROM versions WHERE draft_id = ? "
+                "ORDER BY version_no DESC",
+                (draft_id,),
+            ).fetchall()
+        return [
+            {"version_no": r[0], "created_at": r[1], "title": json.loads(r[2]).get("title"),
+             "lines": r[3]}
+            for r in rows
+        ]
+
+    def _texts(self, hashes: List[str]) -> Dict[str, str]:
+        wanted = list(set(hashes))
+        out: Dict[str, str] = {}
+        for i in range(0, len(wanted), 500):  # stay under SQLite's bound-parameter limit
+            part = wanted[i:i + 500]
+            rows = self._db.execute(
+                f"SELECT hash, text FROM chunks WHERE hash IN ({','.join('?' * len(part))})", part
+            ).fetchall()
+            out.update(rows)
+        return out
+
+    def get_version(self, draft_id: str, version_no: int) -> Optional[Dict[str, Any]]:
+        """The song dict saved as `version_no` (same shape as drafts_store.song_to_dict)."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT fields, melody FROM versions WHERE draft_id = ? AND version_no = ?",
+                (draft_id, version_no),
+            ).fetchone()
+            if row is None:
+                return None
+            line_hashes = self._line_hashes(draft_id, version_no)
+            texts = self._texts(line_hashes + [row[1]])
+        song = json.loads(row[0])
+        song["lyrics"] = [texts[h] for h in line_hashes]
+        song["melody_description"] = texts[row[1]]
+        return song
+
+    def diff_versions(self, draft_id: str, old_no: int, new_no: int) -> Optional[Dict[str, Any]]:
+        """
+        What changed from `old_no` to `new_no`:
+        {"fields": {name: [old, new]}, "lyrics": [{"op", "old_start", "old", "new"}]}
+        where lyric ops are replace/insert/delete runs of lines.
+        """
+        old, new = self.get_version(draft_id, old_no), self.get_version(draft_id, new_no)
+        if old is None or new is None:
+            return None
+        fields = {
+            k: [old.get(k), new.get(k)]
+            for k in ("title", "intent", "genre", "sub_genre", "melody_description")
+            if old.get(k) != new.get(k)
+        }
+        a, b = old["lyrics"], new["lyrics"]
+        lyrics = [
+            {"op": op, "old_start": i1, "old": a[i1:i2], "new": b[j1:j2]}
+            for op, i1, i2, j1, j2 in difflib.SequenceMatcher(None, a, b, autojunk=False).get_opcodes()
+            if op != "equal"
+        ]
+        return {"fields": fields, "lyrics": lyrics}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            versions, drafts, full_bytes = self._db.execute(
+                "SELECT COUNT(*), COUNT(DISTINCT draft_id), COALESCE(SUM(size), 0) FROM versions"
+            ).fetchone()
+            chunks, chunk_bytes = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(CAST(text AS BLOB))), 0) FROM chunks"
+            ).fetchone()
+            index_bytes = self._db.execute(
+                "SELECT COALESCE(SUM(LENGTH(fields) + LENGTH(lyrics) + LENGTH(melody)), 0) FROM versions"
+            ).fetchone()[0]
+        stored = chunk_bytes + index_bytes
+        return {
+            "drafts": drafts,
+            "versions": versions,
+            "chunks": chunks,
+            "stored_bytes": stored,
+            "full_copy_bytes": full_bytes,
+            "dedup_ratio": round(full_bytes / stored, 2) if stored else 0.0,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,206 @@
+"""
+In-process full-text index over drafts, for the searchable sidebar.
+Draft names, intents and lyrics are tokenized into an inverted index
+(token -> draft ids). Our own saves/deletes update it one draft at a time
+(see drafts_store); changes made by other workers are picked up through the
+backend's change_token(), re-tokenizing only drafts whose version changed.
+
+Search is AND over the query words, each matched as a prefix (type-ahead), and
+results keep the drafts list order (newest first), so a page of results costs
+about the same however many drafts exist.
+"""
+
+import bisect
+import heapq
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from src.storage.backends import DraftsBackend
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: str) -> Set[str]:
+    return set(_TOKEN_RE.findall((text or "").lower()))
+
+
+def _draft_tokens(draft: Dict[str, Any]) -> Set[str]:
+    song = draft.get("song") or {}
+    tokens = tokenize(draft.get("name") or "")
+    tokens |= tokenize(song.get("intent") or "")
+    for line in song.get("lyrics") or []:
+        tokens |= tokenize(line)
+    return tokens
+
+
+def _signature(draft: Dict[str, Any]) -> Tuple[Any, ...]:
+    return draft.get("name"), draft.get("updated_at"), (draft.get("song") or {}).get("version")
+
+
+class DraftSearchIndex:
+    """Inverted index over drafts plus their list order; thread-safe."""
+
+    def __init__(self, check_seconds: float = 1.0):
+        self.check_seconds = check_seconds
+        self._lock = threading.RLock()
+        self._postings: Dict[str, Set[str]] = {}
+        self._vocab: List[str] = []  # sorted keys of _postings, for prefix lookups
+        self._doc_tokens: Dict[str, Set[str]] = {}
+        self._docs: Dict[str, Dict[str, Any]] = {}  # id -> {"id", "name", "updated_at"}
+        self._signatures: Dict[str, Tuple[Any, ...]] = {}
+        self._order: Dict[str, int] = {}  # higher = newer position in the list
+        self._next_order = 0
+        self._ordered: Optional[List[str]] = None  # all ids newest first, rebuilt lazily
+
+        self._token = None
+        self._built = False
+        self._checked_at = 0.0
+        self.rebuilds = 0
+        self.reindexed = 0
+        self.searches = 0
+
+    # ---------- maintenance ----------
+    def _unindex(self, draft_id: str) -> None:
+        for tok in self._doc_tokens.pop(draft_id, ()):
+            ids = self._postings.get(tok)
+            if ids is None:
+                continue
+            ids.discard(draft_id)
+            if not ids:
+                del self._postings[tok]
+                i = bisect.bisect_left(self._vocab, tok)
+                if i < len(self._vocab) and self._vocab[i] == tok:
+                    self._vocab.pop(i)
+
+    def _index(self, draft: Dict[str, Any]) -> None:
+        draft_id = draft["id"]
+        tokens = _draft_tokens(draft)
+        old = self._doc_tokens.get(draft_id, set())
+        for tok in old - tokens:
+            ids = self._postings[tok]
+            ids.discard(draft_id)
+            if not ids:
+                del self._postings[tok]
+                self._vocab.pop(bisect.bisect_left(self._vocab, tok))
+        for tok in tokens - old:
+            ids = self._postings.get(tok)
+            if ids is None:
+                self._postings[tok] = ids = set()
+                bisect.insort(self._vocab, tok)
+            ids.add(draft_id)
+        self._doc_tokens[draft_id] = tokens
+        self._docs[draft_id] = {"id": draft_id, "name": draft.get("name") or "", "updated_at": draft.get("updated_at")}
+        self._signatures[draft_id] = _signature(draft)
+        self.reindexed += 1
+
+    def _advance(self, before, after) -> None:
+        """
+        Our own write moved the backend from token `before` to `after`. Only if
+        the index was current at `before` is it current at `after`; otherwise
+        someone else wrote too and the next sync() must reload.
+        """
+        if before is not None and before == self._token:
+            self._token = after
+        else:
+            self._checked_at = 0.0  # don't wait check_seconds to catch up
+
+    def upsert(self, draft: Dict[str, Any], before=None, after=None) -> None:
+        """Index a draft we just saved; `before`/`after` are the backend's change_token() around the save."""
+        with self._lock:
+            if draft["id"] not in self._order:
+                self._next_order += 1
+                self._order[draft["id"]] = self._next_order  # new drafts go first
+                self._ordered = None
+            self._index(draft)
+            self._advance(before, after)
+
+    def remove(self, draft_id: str, before=None, after=None) -> None:
+        with self._lock:
+            self._drop(draft_id)
+            self._advance(before, after)
+
+    def _drop(self, draft_id: str) -> None:
+        self._unindex(draft_id)
+        self._docs.pop(draft_id, None)
+        self._signatures.pop(draft_id, None)
+        if self._order.pop(draft_id, None) is not None:
+            self._ordered = None
+
+    def _rebuild(self, drafts: List[Dict[str, Any]], token) -> None:
+        """Match `drafts` (newest first), re-tokenizing only drafts that changed."""
+        seen = set()
+        n = len(drafts)
+        for i, d in enumerate(drafts):
+            draft_id = d.get("id")
+            if not draft_id:
+                continue
+            seen.add(draft_id)
+            self._order[draft_id] = n - i
+            if self._signatures.get(draft_id) != _signature(d):
+                self._index(d)
+        for draft_id in [k for k in self._docs if k not in seen]:
+            self._drop(draft_id)
+        self._next_order = n
+        self._ordered = None
+        self._token = token
+        self._built = True
+        self.rebuilds += 1
+
+    def sync(self, backend: DraftsBackend, force: bool = False) -> None:
+        """Catch up with changes other workers made (checked at most every check_seconds)."""
+        with self._lock:
+            now = time.monotonic()
+            if self._built and not force and now - self._checked_at < self.check_seconds:
+                return
+            self._checked_at = now
+            token = backend.change_token()
+            if self._built and not force and token is not None and token == self._token:
+                return
+            self._rebuild(backend.load_all(), token)
+
+    # ---------- queries ----------
+    def _prefix_ids(self, prefix: str) -> Set[str]:
+        out: Set[str] = set()
+        i = bisect.bisect_left(self._vocab, prefix)
+        while i < len(self._vocab) and self._vocab[i].startswith(prefix):
+            out |= self._postings[self._vocab[i]]
+            i += 1
+        return out
+
+    def _all_ids(self) -> List[str]:
+        if self._ordered is None:
+            self._ordered = sorted(self._order, key=self._order.__getitem__, reverse=True)
+        return self._ordered
+
+    def search(self, query: str = "", offset: int = 0, limit: int = 20) -> Tuple[int, List[Dict[str, Any]]]:
+        """(total matches, one page of {"id", "name", "updated_at"}) in list order."""
+        words = sorted(tokenize(query), key=len, reverse=True)  # longest prefix = smallest set first
+        with self._lock:
+            self.searches += 1
+            if not words:
+                ids = self._all_ids()
+                total = len(ids)
+                page = ids[offset:offset + limit]
+            else:
+                matched: Optional[Set[str]] = None
+                for w in words:
+                    hits = self._prefix_ids(w)
+                    matched = hits if matched is None else matched & hits
+                    if not matched:
+                        break
+                matched = matched or set()
+                total = len(matched)
+                page = heapq.nlargest(offset + limit, matched, key=self._order.__getitem__)[offset:]
+            return total, [dict(self._docs[i]) for i in page]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "drafts": len(self._docs),
+                "tokens": len(self._postings),
+                "rebuilds": self.rebuilds,
+                "reindexed_drafts": self.reindexed,
+                "searches": self.searches,
+            }
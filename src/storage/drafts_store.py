@@ -1,84 +1,255 @@
-import json
 import os
+import threading
 import uuid
 from datetime import datetime
-from typing import List, Dict, Any, Optional
+from typing import Callable, Iterable, List, Dict, Any, Optional, Tuple
 
+from src.config.settings import (
+    DRAFTS_BACKEND, DRAFTS_LOCK_TIMEOUT, DRAFTS_CACHE_CHECK_SECONDS,
+    DRAFTS_JOURNAL_FSYNC, DRAFTS_JOURNAL_COMPACT_MIN_DEAD, DRAFTS_JOURNAL_COMPACT_RATIO,
+    DRAFTS_JOURNAL_MAX_PATCHES, DRAFTS_HISTORY_ENABLED,
+)
 from src.models.song import Song
+from src.storage.backends import DraftsBackend, JsonDraftsBackend, song_rev
+from src.storage.draft_history import DraftHistory
+from src.storage.draft_search import DraftSearchIndex
 
 
 DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "data")
 DRAFTS_PATH = os.path.join(DATA_DIR, "drafts.json")
+DRAFTS_DB_PATH = os.path.join(DATA_DIR, "drafts.db")
+DRAFTS_JOURNAL_PATH = os.path.join(DATA_DIR, "drafts.journal")
+DRAFTS_HISTORY_PATH = os.path.join(DATA_DIR, "draft_history.db")
 
+_backend: Optional[DraftsBackend] = None
+_backend_key = None
+_backend_lock = threading.Lock()
+_write_lock = threading.Lock()  # one write of ours at a time, so change tokens bracket exactly it
+_search_index: Optional[DraftSearchIndex] = None
+_search_backend: Optional[DraftsBackend] = None
+_history: Optional[DraftHistory] = None
 
-def _ensure_file():
-    os.makedirs(DATA_DIR, exist_ok=True)
-    if not os.path.exists(DRAFTS_PATH):
-        with open(DRAFTS_PATH, "w", encoding="utf-8") as f:
-            json.dump([], f, ensure_ascii=False, indent=2)
+
+def get_backend() -> DraftsBackend:
+    """Process-wide drafts backend (rebuilt if DRAFTS_BACKEND or the paths are changed)."""
+    global _backend, _backend_key
+    key = (DRAFTS_BACKEND, DRAFTS_PATH, DRAFTS_DB_PATH, DRAFTS_JOURNAL_PATH)
+    if _backend is None or _backend_key != key:
+        with _backend_lock:
+            if _backend is None or _backend_key != key:
+                _backend = _make_backend(DRAFTS_BACKEND)
+                _backend_key = key
+    return _backend
+
+
+def _make_backend(kind: str) -> DraftsBackend:
+    if kind == "json":
+        return JsonDraftsBackend(
+            DRAFTS_PATH, lock_timeout=DRAFTS_LOCK_TIMEOUT, cache_check_seconds=DRAFTS_CACHE_CHECK_SECONDS
+        )
+    if kind == "sqlite":
+        from src.storage.sqlite_backend import SqliteDraftsBackend
+        backend = SqliteDraftsBackend(DRAFTS_DB_PATH)
+        imported = backend.import_json(DRAFTS_PATH)  # one-time migration, no-op afterwards
+        if imported:
+            print(f"Migrated {imported} drafts from {DRAFTS_PATH} to {DRAFTS_DB_PATH}")
+        return backend
+    if kind == "journal":
+        from src.storage.journal_backend import JournalDraftsBackend
+        backend = JournalDraftsBackend(
+            DRAFTS_JOURNAL_PATH,
+            lock_timeout=DRAFTS_LOCK_TIMEOUT,
+            fsync=DRAFTS_JOURNAL_FSYNC,
+            compact_min_dead=DRAFTS_JOURNAL_COMPACT_MIN_DEAD,
+            compact_ratio=DRAFTS_JOURNAL_COMPACT_RATIO,
+            max_patches=DRAFTS_JOURNAL_MAX_PATCHES,
+        )
+        imported = backend.import_json(DRAFTS_PATH)  # only when the journal is created
+        if imported:
+            print(f"Migrated {imported} drafts from {DRAFTS_PATH} to {DRAFTS_JOURNAL_PATH}")
+        return backend
+    raise ValueError(f"Unknown drafts backend: {kind}")
+
+
+def migrate_json_to_sqlite(json_path: Optional[str] = None, db_path: Optional[str] = None) -> int:
+    """Copy drafts.json into the SQLite store (even if a migration already ran). Returns drafts copied."""
+    from src.storage.sqlite_backend import SqliteDraftsBackend
+    backend = SqliteDraftsBackend(db_path or DRAFTS_DB_PATH)
+    try:
+        return backend.import_json(json_path or DRAFTS_PATH, force=True)
+    finally:
+        backend.close()
 
 
 def song_to_dict(song: Song):
     return {
         "title": song.title,
         "intent": getattr(song, "intent", ""),
-        "lyrics": getattr(song, "lyrics", []) or [],
+        "lyrics": list(getattr(song, "lyrics", []) or []),
         "melody_description": getattr(song, "melody_description", "") or "",
         "genre": getattr(song, "genre", None),
         "sub_genre": getattr(song, "sub_genre", None),
+        "version": getattr(song, "version", 0),
     }
 
 
 def dict_to_song(data: Dict[str, Any]) -> Song:
     song = Song(title=data.get("title") or "Untitled", intent=data.get("intent") or "")
-    song.lyrics = data.get("lyrics") or []
+    song.lyrics = list(data.get("lyrics") or [])  # own copy: drafts lists are cached/shared
     song.melody_description = data.get("melody_description") or ""
     song.genre = data.get("genre")
     song.sub_genre = data.get("sub_genre")
+    song.version = data.get("version") or 0
+    song.mark_clean()
+    song.saved_rev = song_rev(data)
     return song
 
 
 def load_drafts() -> List[Dict[str, Any]]:
-    _ensure_file()
-    with open(DRAFTS_PATH, "r", encoding="utf-8") as f:
-        return json.load(f) or []
+    return get_backend().load_all()
+
+
+def get_draft(draft_id: str) -> Optional[Dict[str, Any]]:
+    return get_backend().get(draft_id)
+
+
+def get_search_index() -> DraftSearchIndex:
+    """Search index over the current backend's drafts (a fresh one if the backend changed)."""
+    global _search_index, _search_backend
+    backend = get_backend()
+    if _search_index is None or _search_backend is not backend:
+        with _backend_lock:
+            if _search_index is None or _search_backend is not backend:
+                _search_index = DraftSearchIndex(check_seconds=DRAFTS_CACHE_CHECK_SECONDS)
+                _search_backend = backend
+    return _search_index
+
+
+def search_drafts(query: str = "", offset: int = 0, limit: int = 20) -> Tuple[int, List[Dict[str, Any]]]:
+    """
+    One page of drafts whose name, intent or lyrics match every word of `query`
+    (as word prefixes), newest first: (total matches, [{"id", "name", "updated_at"}]).
+    """
+    index = get_search_index()
+    index.sync(get_backend())
+    return index.search(query, offset=offset, limit=limit)
+
+
+def get_history() -> DraftHistory:
+    """Process-wide version history (reopened if DRAFTS_HISTORY_PATH is changed)."""
+    global _history
+    if _history is None or _history.path != DRAFTS_HISTORY_PATH:
+        with _backend_lock:
+            if _history is None or _history.path != DRAFTS_HISTORY_PATH:
+                _history = DraftHistory(DRAFTS_HISTORY_PATH)
+    return _history
+
+
+def _write(backend: DraftsBackend, write: Callable[[], Any], draft_id: str,
+           indexed: Optional[Dict[str, Any]] = None) -> Any:
+    """
+    Run one write of ours and update the search index with it: `indexed` is the
+    saved draft, or None for a delete. The backend's change tokens from just
+    before and after the write tell the index whether it saw every other change.
+    """
+    with _write_lock:
+        index = _search_index if _search_backend is backend else None
+        before = backend.change_token() if index is not None else None
+        result = write()
+        if index is not None and result is not False:
+            after = backend.change_token()
+            if indexed is None:
+                index.remove(draft_id, before=before, after=after)
+            else:
+                index.upsert(indexed, before=before, after=after)
+    return result
+
+
+def _record_history(payload: Dict[str, Any]) -> None:
+    if DRAFTS_HISTORY_ENABLED:
+        try:
+            get_history().record(payload["id"], payload["song"], created_at=payload["updated_at"])
+        except Exception as e:  # history is a convenience; never fail the save over it
+            print(f"Recording history of draft {payload['id']} failed: {e}")
+
+
+def list_draft_versions(draft_id: str) -> List[Dict[str, Any]]:
+    """Saved versions of a draft, newest first: [{"version_no", "created_at", "title", "lines"}]."""
+    return get_history().list_versions(draft_id)
+
+
+def diff_draft_versions(draft_id: str, old_no: int, new_no: int) -> Optional[Dict[str, Any]]:
+    return get_history().diff_versions(draft_id, old_no, new_no)
+
+
+def restore_draft_version(draft_id: str, version_no: int, current: Optional[Song] = None) -> Optional[Song]:
+    """
+    The song as saved in `version_no`, ready to be saved over the draft (not saved
+    here: the caller saves it, e.g. through the autosaver). It is marked as never
+    saved, so that save writes it in full, and its version follows `current`'s.
+    """
+    data = get_history().get_version(draft_id, version_no)
+    if data is None:
+        return None
+    song = dict_to_song(data)
+    song.version = max(song.version, current.version if current is not None else 0) + 1
+    song.saved_version = None
+    return song
 
 
 def save_draft(song: Song, draft_id: Optional[str] = None) -> str:
-    _ensure_file()
-    drafts = load_drafts()
+    backend = get_backend()
 
     now = datetime.utcnow().isoformat(timespec="seconds") + "Z"
     payload = {
         "id": draft_id or str(uuid.uuid4()),
-        "name": _safe_title_or_auto(song.title, drafts),
+        "name": _safe_title_or_auto(song.title, backend),
         "updated_at": now,
         "song": song_to_dict(song),
     }
 
-    # update if exists, else insert
-    for i, d in enumerate(drafts):
-        if d.get("id") == payload["id"]:
-            drafts[i] = payload
-            break
-    else:
-        drafts.insert(0, payload)  # newest first
-
-    with open(DRAFTS_PATH, "w", encoding="utf-8") as f:
-        json.dump(drafts, f, ensure_ascii=False, indent=2)
+    # update if exists, else insert (newest first)
+    _write(backend, lambda: backend.upsert(payload), payload["id"], indexed=payload)
+    _record_history(payload)
+    song.mark_clean()
+    song.saved_rev = song_rev(payload["song"])
 
     return payload["id"]
 
 
+def save_draft_delta(song: Song, draft_id: Optional[str] = None) -> str:
+    """
+    Save only what changed since the song was loaded or last saved.
+    Nothing is written if the song is unchanged; falls back to save_draft for
+    new drafts or if the stored draft is no longer the revision the song was
+    loaded/saved as (e.g. another session saved it meanwhile).
+    """
+    if draft_id and not song.is_dirty:
+        return draft_id
+
+    if draft_id and song.saved_version is not None and song.saved_rev:
+        backend = get_backend()
+        now = datetime.utcnow().isoformat(timespec="seconds") + "Z"
+        name = _safe_title_or_auto(song.title, backend)
+        data = song_to_dict(song)
+        payload = {"id": draft_id, "name": name, "updated_at": now, "song": data}
+        if _write(backend, lambda: backend.apply_delta(draft_id, song.delta(), name, now), draft_id,
+                  indexed=payload):
+            _record_history(payload)
+            song.mark_clean()
+            song.saved_rev = song_rev(data)
+            return draft_id
+
+    return save_draft(song, draft_id)
+
+
 def delete_draft(draft_id: str) -> None:
-    _ensure_file()
-    drafts = [d for d in load_drafts() if d.get("id") != draft_id]
-    with open(DRAFTS_PATH, "w", encoding="utf-8") as f:
-        json.dump(drafts, f, ensure_ascii=False, indent=2)
+    backend = get_backend()
+    _write(backend, lambda: backend.delete(draft_id), draft_id)
 
 
-def _next_draft_name(drafts, base="Draft") -> str:
-    existing = {(d.get("name") or "").strip().upper() for d in drafts}
+def _next_draft_name(existing: Iterable[str], base="Draft") -> str:
+    existing = set(existing)
 
     n = 1
     while f"{base} {n}".upper() in existing:
@@ -86,18 +257,12 @@ def _next_draft_name(drafts, base="Draft") -> str:
     return f"{base} {n}"
 
 
-def _safe_title_or_auto(song_title: str, drafts) -> str:
+def _safe_title_or_auto(song_title: str, backend: DraftsBackend) -> str:
     t = (song_title or "").strip()
-    return t if t else _next_draft_name(drafts, base="Draft")
+    return t if t else _next_draft_name(backend.names("Draft "), base="Draft")
 
 
 def next_draft_title(base="Draft") -> str:
-    drafts = load_drafts()
-    existing = {(d.get("name") or "").strip().upper() for d in drafts}
-
-    n = 1
-    while f"{base} {n}".upper() in existing:
-        n += 1
-    return f"{base} {n}"
+    return _next_draft_name(get_backend().names(f"{base} "), base=base)
 
 
@@ -0,0 +1,148 @@
+"""
+Inter-process file locking and atomic file writes for the drafts store.
+Several Streamlit workers can share one data/ volume, so every
+read-modify-write of drafts.json holds an advisory lock on a sidecar
+.lock file, and files are replaced atomically (readers never see a
+half-written file).
+"""
+
+import os
+import random
+import tempfile
+import time
+from typing import Callable, Optional, TypeVar
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+T = TypeVar("T")
+
+
+class LockTimeout(TimeoutError):
+    pass
+
+
+def _try_lock(fd: int, blocking: bool = False) -> bool:
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            # LK_LOCK itself gives up after ~10s; the caller loops
+            os.lseek(fd, 0, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+
+def _unlock(fd: int) -> None:
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    else:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+
+class FileLock:
+    """
+    Exclusive advisory lock on `path` (created if missing), usable across
+    processes and threads.
+    With a timeout it polls with jittered exponential backoff, then raises
+    LockTimeout. With timeout=None it blocks in the OS lock queue (fair, no
+    polling); the OS drops the lock if its holder dies, so this cannot
+    deadlock on a crashed worker. If the blocking call itself fails (ENOLCK on
+    NFS, Windows giving up after ~10s) it is retried with backoff, up to
+    `blocking_attempts` times, then LockTimeout is raised.
+    """
+
+    def __init__(self, path: str, timeout: Optional[float] = None, base_delay: float = 0.005,
+                 max_delay: float = 0.05, blocking_attempts: int = 8, blocking_max_delay: float = 2.0):
+        self.path = path
+        self.timeout = timeout
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.blocking_attempts = blocking_attempts
+        self.blocking_max_delay = blocking_max_delay
+        self._fd = None
+
+    def _acquire_blocking(self, fd: int) -> None:
+        for attempt in range(self.blocking_attempts):
+            if _try_lock(fd, blocking=True):
+                return
+            if attempt + 1 < self.blocking_attempts:
+                time.sleep(random.uniform(0, min(self.blocking_max_delay, 0.05 * (2 ** attempt))))
+        os.close(fd)
+        raise LockTimeout(
+            f"Could not lock {self.path}: the lock call kept failing "
+            f"({self.blocking_attempts} attempts; does the filesystem support locking?)"
+        )
+
+    def acquire(self) -> None:
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        if self.timeout is None:
+            self._acquire_blocking(fd)
+            self._fd = fd
+            return
+
+        deadline = time.monotonic() + self.timeout
+        attempt = 0
+        while not _try_lock(fd):
+            if time.monotonic() >= deadline:
+                os.close(fd)
+                raise LockTimeout(f"Could not lock {self.path} within {self.timeout}s")
+            time.sleep(random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt))))
+            attempt += 1
+        self._fd = fd
+
+    def release(self) -> None:
+        if self._fd is None:
+            return
+        try:
+            _unlock(self._fd)
+        finally:
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self) -> "FileLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
+
+
+def with_retries(fn: Callable[[], T], attempts: int = 5, base_delay: float = 0.02) -> T:
+    """Retry fn on OSError (e.g. os.replace over a file another process holds open on Windows)."""
+    for attempt in range(attempts - 1):
+        try:
+            return fn()
+        except OSError:
+            time.sleep(random.uniform(0, base_delay * (2 ** attempt)))
+    return fn()
+
+
+def atomic_write_text(path: str, text: str) -> None:
+    """Write to a temp file in the same dir, fsync, then os.replace over `path`."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        with_retries(lambda: os.replace(tmp, path))
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+    # make the rename itself durable (POSIX only; directories can't be opened on Windows)
+    if fcntl is not None:
+        dir_fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
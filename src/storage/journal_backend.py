@@ -0,0 +1,317 @@
+"""
+Append-only journal drafts backend for ECHO application.
+Every save/delete appends one JSON line to data/drafts.journal:
+
+    {"op": "put", "draft": {...}}
+    {"op": "patch", "id": "...", "name": "...", "updated_at": "...", "delta": {...}}
+    {"op": "del", "id": "..."}
+
+"patch" records hold a Song.delta() (changed fields + lyric line edits), so a
+delta save appends only what changed.
+
+An in-memory index maps draft id -> offset of its latest "put" record (plus
+the patches after it), so a save costs one append and startup streams the
+journal line by line. Records made obsolete by later saves/deletes are "dead";
+once there are enough of them, a background thread rewrites the journal with
+one folded "put" per live draft.
+
+Several workers may share the file: appends hold the inter-process lock and
+each process catches up on records other workers appended (or rebuilds its
+index if another worker compacted the file) before using its index.
+"""
+
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from src.storage.backends import DraftsBackend, apply_song_delta, rebase_song_delta
+from src.storage.file_lock import FileLock, atomic_write_text
+
+
+class _Entry:
+    __slots__ = ("offset", "created", "name", "patches")
+
+    def __init__(self, offset: int, created: int, name: str):
+        self.offset = offset
+        self.created = created  # list position: first save of the id; updates keep it
+        self.name = name
+        self.patches: List[int] = []  # offsets of "patch" records after the "put"
+
+
+class JournalDraftsBackend(DraftsBackend):
+    name = "journal"
+
+    def __init__(self, path: str, lock_timeout: Optional[float] = None, fsync: bool = True,
+                 compact_min_dead: int = 500, compact_ratio: float = 0.5, max_patches: int = 32):
+        self.path = path
+        self.max_patches = max_patches
+        self.lock_timeout = lock_timeout
+        self.fsync = fsync
+        self.compact_min_dead = compact_min_dead
+        self.compact_ratio = compact_ratio
+
+        self._lock = threading.RLock()
+        self._index: Dict[str, _Entry] = {}
+        self._created = 0
+        self._records = 0
+        self._dead = 0
+        self._size = 0  # bytes of the journal this index covers
+        self._inode = None
+        self.compactions = 0
+
+        self._compact_wanted = threading.Event()
+        self._compactor: Optional[threading.Thread] = None
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._file_lock():
+            self.is_new = not os.path.exists(path)
+            if self.is_new:
+                open(path, "ab").close()
+            self._sync()
+
+    def _file_lock(self) -> FileLock:
+        return FileLock(self.path + ".lock", timeout=self.lock_timeout)
+
+    # ---------- index ----------
+    def _apply(self, rec: Dict[str, Any], offset: int) -> None:
+        self._records += 1
+        if rec.get("op") == "put":
+            draft = rec.get("draft") or {}
+            draft_id = draft.get("id")
+            if not draft_id:
+                return
+            old = self._index.get(draft_id)
+            if old is not None:
+                self._dead += 1 + len(old.patches)
+                created = old.created
+            else:
+                self._created += 1
+                created = self._created
+            self._index[draft_id] = _Entry(offset, created, (draft.get("name") or "").strip().upper())
+        elif rec.get("op") == "patch":
+            entry = self._index.get(rec.get("id"))
+            if entry is None:
+                self._dead += 1
+                return
+            entry.patches.append(offset)
+            entry.name = (rec.get("name") or "").strip().upper()
+        elif rec.get("op") == "del":
+            self._dead += 1  # the delete record itself is never needed after compaction
+            old = self._index.pop(rec.get("id"), None)
+            if old is not None:
+                self._dead += 1 + len(old.patches)
+
+    def _sync(self) -> None:
+        """Bring the index up to date with the file (records appended or a compaction by other workers)."""
+        st = os.stat(self.path)
+        if st.st_ino != self._inode or st.st_size < self._size:
+            self._index.clear()
+            self._created = self._records = self._dead = self._size = 0
+            self._inode = st.st_ino
+        if st.st_size == self._size:
+            return
+
+        with open(self.path, "rb") as f:
+            f.seek(self._size)
+            offset = self._size
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # torn tail from a crashed writer; the next append starts after it
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    rec = None
+                if rec is not None:
+                    self._apply(rec, offset)
+                offset += len(line)
+            self._size = offset
+
+    def _append_locked(self, rec: Dict[str, Any]) -> None:
+        """Append one record; caller holds both locks and has just called _sync()."""
+        line = (json.dumps(rec, ensure_ascii=False) + "\n").encode("utf-8")
+        with open(self.path, "r+b") as f:
+            f.seek(self._size)  # drops a torn tail, if any
+            f.write(line)
+            f.truncate()
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        self._apply(rec, self._size)
+        self._size += len(line)
+
+    def _append(self, rec: Dict[str, Any]) -> None:
+        with self._lock, self._file_lock():
+            self._sync()
+            self._append_locked(rec)
+        self._maybe_compact()
+
+    @staticmethod
+    def _record_at(f, offset: int) -> Dict[str, Any]:
+        f.seek(offset)
+        return json.loads(f.readline())
+
+    def _read_at(self, f, entry: _Entry) -> Dict[str, Any]:
+        """The draft as of its latest save: the "put" record with its patches replayed."""
+        draft = self._record_at(f, entry.offset)["draft"]
+        for offset in entry.patches:
+            rec = self._record_at(f, offset)
+            try:
+                song = apply_song_delta(draft.get("song") or {}, rec.get("delta") or {})
+            except (IndexError, KeyError, TypeError):
+                # a patch that doesn't fit (journals written before deltas were checked against
+                # the stored content): keep the draft as it was rather than break every read
+                print(f"Skipping a drafts journal patch that does not apply to draft {draft.get('id')}")
+                continue
+            draft = {**draft, "name": rec.get("name"), "updated_at": rec.get("updated_at"), "song": song}
+        return draft
+
+    def _refresh(self) -> None:
+        st = os.stat(self.path)
+        if st.st_ino != self._inode or st.st_size != self._size:
+            with self._file_lock():
+                self._sync()
+
+    def _open_synced(self):
+        """
+        Open the journal for reading at index offsets (caller holds self._lock).
+        The check is on the opened file itself, so a compaction that replaces
+        the path in between can't pair our offsets with the new file; an fd
+        opened under the lock keeps reading the file the index was built from.
+        """
+        f = open(self.path, "rb")
+        st = os.fstat(f.fileno())
+        if st.st_ino == self._inode and st.st_size == self._size:
+            return f
+        f.close()
+        with self._file_lock():
+            self._sync()
+            return open(self.path, "rb")
+
+    # ---------- DraftsBackend ----------
+    def load_all(self) -> List[Dict[str, Any]]:
+        with self._lock, self._open_synced() as f:
+            entries = sorted(self._index.values(), key=lambda e: e.created, reverse=True)
+            return [self._read_at(f, e) for e in entries]
+
+    def get(self, draft_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock, self._open_synced() as f:
+            entry = self._index.get(draft_id)
+            if entry is None:
+                return None
+            return self._read_at(f, entry)
+
+    def upsert(self, payload: Dict[str, Any]) -> None:
+        self._append({"op": "put", "draft": payload})
+
+    def apply_delta(self, draft_id: str, delta: Dict[str, Any], name: str, updated_at: str) -> bool:
+        with self._lock, self._file_lock():
+            self._sync()
+            entry = self._index.get(draft_id)
+            if entry is None:
+                return False
+            # replay on the current record first: only a delta that fits gets appended
+            with open(self.path, "rb") as f:
+                draft = self._read_at(f, entry)
+            song = rebase_song_delta(draft, delta)
+            if song is None:
+                return False
+            if len(entry.patches) >= self.max_patches:
+                # keep reads cheap: fold the chain into a fresh full record
+                self._append_locked({"op": "put", "draft": {**draft, "name": name, "updated_at": updated_at,
+                                                            "song": song}})
+            else:
+                self._append_locked({"op": "patch", "id": draft_id, "name": name,
+                                     "updated_at": updated_at, "delta": delta})
+        self._maybe_compact()
+        return True
+
+    def delete(self, draft_id: str) -> None:
+        with self._lock:
+            self._refresh()
+            if draft_id not in self._index:
+                return
+        self._append({"op": "del", "id": draft_id})
+
+    def names(self, prefix: str = "") -> Set[str]:
+        prefix = prefix.upper()
+        with self._lock:
+            self._refresh()
+            return {e.name for e in self._index.values() if e.name.startswith(prefix)}
+
+    def change_token(self) -> Any:
+        with self._lock:
+            self._refresh()
+            return self._inode, self._size
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "backend": self.name,
+                "live_drafts": len(self._index),
+                "records": self._records,
+                "dead_records": self._dead,
+                "journal_bytes": self._size,
+                "compactions": self.compactions,
+            }
+
+    # ---------- compaction ----------
+    def _needs_compaction(self) -> bool:
+        return self._dead >= self.compact_min_dead and self._dead >= self.compact_ratio * self._records
+
+    def _maybe_compact(self) -> None:
+        if not self._needs_compaction():
+            return
+        if self._compactor is None or not self._compactor.is_alive():
+            self._compactor = threading.Thread(target=self._compact_loop, name="drafts-journal-compactor",
+                                               daemon=True)
+            self._compactor.start()
+        self._compact_wanted.set()
+
+    def _compact_loop(self) -> None:
+        while self._compact_wanted.wait(timeout=30.0):
+            self._compact_wanted.clear()
+            try:
+                self.compact()
+            except Exception as e:
+                print(f"Drafts journal compaction failed: {e}")
+        self._compactor = None
+
+    def compact(self) -> Tuple[int, int]:
+        """Rewrite the journal with only the live drafts. Returns (bytes before, bytes after)."""
+        with self._lock, self._file_lock():
+            self._sync()
+            before = self._size
+            entries = sorted(self._index.values(), key=lambda e: e.created)  # replay keeps the order
+            with open(self.path, "rb") as f:
+                lines = [
+                    json.dumps({"op": "put", "draft": self._read_at(f, e)}, ensure_ascii=False) + "\n"
+                    for e in entries
+                ]
+            atomic_write_text(self.path, "".join(lines))
+
+            self._inode = None  # new file: rebuild offsets from it
+            self._sync()
+            self.compactions += 1
+            return before, self._size
+
+    # ---------- migration ----------
+    def import_json(self, json_path: str) -> int:
+        """Seed a newly created journal from drafts.json (keeps the order). Returns drafts imported."""
+        with self._lock:
+            self._refresh()
+            if not self.is_new or self._records or not os.path.exists(json_path):
+                return 0
+        with open(json_path, "r", encoding="utf-8") as f:
+            drafts = json.load(f) or []
+        lines = [
+            json.dumps({"op": "put", "draft": d}, ensure_ascii=False) + "\n"
+            for d in reversed(drafts) if d.get("id")  # file is newest first
+        ]
+        with self._lock, self._file_lock():
+            with open(self.path, "ab") as f:  # one write + fsync for the whole import
+                f.write("".join(lines).encode("utf-8"))
+                f.flush()
+                os.fsync(f.fileno())
+            self._sync()
+        return len(lines)
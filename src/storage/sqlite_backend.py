@@ -0,0 +1,140 @@
+"""
+SQLite drafts backend for ECHO application.
+One row per draft (WAL mode, indexed on id and updated_at), so saving a draft
+costs the same however many drafts exist. Drafts from an existing drafts.json
+are imported once, on first open of an empty database.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional, Set
+
+from src.storage.backends import DraftsBackend, rebase_song_delta
+
+_SCHEMA = (
+    # seq keeps the JSON store's order: new drafts go first, updates keep their place
+    "CREATE TABLE IF NOT EXISTS drafts ("
+    "seq INTEGER PRIMARY KEY AUTOINCREMENT, "
+    "id TEXT NOT NULL UNIQUE, "
+    "name TEXT NOT NULL DEFAULT '', "
+    "updated_at TEXT NOT NULL DEFAULT '', "
+    "song TEXT NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS idx_drafts_updated_at ON drafts(updated_at)",
+    "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)",
+)
+
+
+def _row_to_draft(row) -> Dict[str, Any]:
+    return {"id": row[0], "name": row[1], "updated_at": row[2], "song": json.loads(row[3])}
+
+
+class SqliteDraftsBackend(DraftsBackend):
+    name = "sqlite"
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=10.0)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        for stmt in _SCHEMA:
+            self._db.execute(stmt)
+        self._db.commit()
+
+    def load_all(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._db.execute("SELECT id, name, updated_at, song FROM drafts ORDER BY seq DESC").fetchall()
+        return [_row_to_draft(r) for r in rows]
+
+    def get(self, draft_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, name, updated_at, song FROM drafts WHERE id = ?", (draft_id,)
+            ).fetchone()
+        return _row_to_draft(row) if row else None
+
+    def upsert(self, payload: Dict[str, Any]) -> None:
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT INTO drafts (id, name, updated_at, song) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET name = excluded.name, "
+                "updated_at = excluded.updated_at, song = excluded.song",
+                (payload["id"], payload.get("name") or "", payload.get("updated_at") or "",
+                 json.dumps(payload.get("song") or {}, ensure_ascii=False)),
+            )
+
+    def apply_delta(self, draft_id: str, delta: Dict[str, Any], name: str, updated_at: str) -> bool:
+        with self._lock, self._db:
+            self._db.execute("BEGIN IMMEDIATE")  # no other writer between the check and the update
+            row = self._db.execute(
+                "SELECT id, name, updated_at, song FROM drafts WHERE id = ?", (draft_id,)
+            ).fetchone()
+            song = rebase_song_delta(_row_to_draft(row) if row else None, delta)
+            if song is None:
+                return False
+            self._db.execute(
+                "UPDATE drafts SET name = ?, updated_at = ?, song = ? WHERE id = ?",
+                (name, updated_at, json.dumps(song, ensure_ascii=False), draft_id),
+            )
+        return True
+
+    def delete(self, draft_id: str) -> None:
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM drafts WHERE id = ?", (draft_id,))
+
+    def names(self, prefix: str = "") -> Set[str]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT name FROM drafts WHERE name LIKE ? ESCAPE '\\'",
+                (prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%",),
+            ).fetchall()
+        return {(r[0] or "").strip().upper() for r in rows}
+
+    def change_token(self) -> Any:
+        # bumped by commits from other connections (our own writes keep it)
+        with self._lock:
+            return self._db.execute("PRAGMA data_version").fetchone()[0]
+
+    def count(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM drafts").fetchone()[0]
+
+    # ---------- migration ----------
+    def _meta(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def import_json(self, json_path: str, force: bool = False) -> int:
+        """
+        Copy drafts from a drafts.json list into the database (keeps their order).
+        Runs once: later calls are no-ops unless force=True. Returns drafts imported.
+        """
+        if not force and self._meta("migrated_from_json"):
+            return 0
+        drafts: List[Dict[str, Any]] = []
+        if os.path.exists(json_path):
+            with open(json_path, "r", encoding="utf-8") as f:
+                drafts = json.load(f) or []
+
+        with self._lock, self._db:
+            for d in reversed(drafts):  # file is newest first; seq grows with insertion
+                if not d.get("id"):
+                    continue
+                self._db.execute(
+                    "INSERT OR IGNORE INTO drafts (id, name, updated_at, song) VALUES (?, ?, ?, ?)",
+                    (d["id"], d.get("name") or "", d.get("updated_at") or "",
+                     json.dumps(d.get("song") or {}, ensure_ascii=False)),
+                )
+            self._db.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('migrated_from_json', ?)",
+                (os.path.abspath(json_path),),
+            )
+        return len(drafts)
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
@@ -3,18 +3,22 @@ import html
 import streamlit.components.v1 as components
 import re
 
-from src.utils.context_builder import build_song_snapshot
+from src.utils.prompt_builder import assemble_prompt
+from src.utils.chat_summary import compact_history
 from src.config.settings import (
     COLORS, MODE_LYRICS, MODE_MELODY, DEFAULT_MODE,
-    DEFAULT_SONG_TITLE, BUTTON_STYLES
+    DEFAULT_SONG_TITLE, BUTTON_STYLES, AUTOSAVE_ENABLED, DRAFTS_SIDEBAR_PAGE_SIZE, DRAFTS_HISTORY_ENABLED
 )
 from src.models.song import Song
-from src.agents.lyrics_agent import LyricsAgent
-from src.agents.melody_agent import MelodyAgent
+from src.agents.registry import get_lyrics_agent, get_melody_agent
 from src.ui.genre_tiles import render_genre_tiles
-from src.storage.drafts_store import load_drafts, dict_to_song, save_draft, delete_draft, next_draft_title
+from src.storage.drafts_store import (
+    search_drafts, get_draft, dict_to_song, delete_draft, next_draft_title,
+    list_draft_versions, diff_draft_versions, restore_draft_version,
+)
+from src.storage.autosave import get_autosaver
 from src.services import music_generator
-from src.agents.knowledge_base import retrieve_rules, format_rules_for_prompt
+from src.agents.knowledge_base import retrieve_rules_incremental, format_rules_for_prompt
 
 
 def inject_global_css():
@@ -501,6 +505,10 @@ def initialize_session_state():
     if "chat_history" not in st.session_state:
         st.session_state.chat_history = []
 
+    # older turns folded out of chat_history (see src/utils/chat_summary.py)
+    if "chat_summary" not in st.session_state:
+        st.session_state.chat_summary = ""
+
     if "selected_line_index" not in st.session_state:
         st.session_state.selected_line_index = None
 
@@ -537,17 +545,17 @@ def initialize_session_state():
     if "current_draft_id" not in st.session_state:
         st.session_state.current_draft_id = None
 
-    # Initialize AI agents
+    # AI agents are shared by all sessions (one client per process)
     if "lyrics_agent" not in st.session_state:
         try:
-            st.session_state.lyrics_agent = LyricsAgent()
+            st.session_state.lyrics_agent = get_lyrics_agent()
         except Exception as e:
             st.session_state.lyrics_agent = None
             st.error(f"Failed to initialize AI agent: {str(e)}")
 
     if "melody_agent" not in st.session_state:
         try:
-            st.session_state.melody_agent = MelodyAgent()
+            st.session_state.melody_agent = get_melody_agent()
         except Exception as e:
             st.session_state.melody_agent = None
             st.error(f"Failed to initialize AI agent: {str(e)}")
@@ -685,6 +693,19 @@ def render_main_workspace():
         render_chat_panel_header()
         render_chat()
 
+    autosave_current_song()
+
+
+def autosave_current_song(immediate: bool = False):
+    """Queue the open song for a background save if it changed (never blocks on disk)."""
+    song = st.session_state.get("current_song")
+    if not AUTOSAVE_ENABLED or song is None:
+        return
+    draft_id = st.session_state.get("current_draft_id")
+    if draft_id is None and not song.lyrics:
+        return  # don't create a draft for a song nobody has written anything in yet
+    st.session_state.current_draft_id = get_autosaver().submit(song, draft_id, immediate=immediate)
+
 
 def render_chat_panel_header():
     mode_label = st.session_state.get("current_mode", MODE_LYRICS)
@@ -760,10 +781,22 @@ def render_lyrics_panel():
     with bcol:
         if st.button("💾", key="save_draft_btn_small", help="Save Draft", use_container_width=True):
             draft_id = st.session_state.get("current_draft_id")
-            st.session_state.current_draft_id = save_draft(song, draft_id)
-            st.toast("Saved!")
+            # queued for the background writer, ahead of the debounce (only the changes are written)
+            st.session_state.current_draft_id = get_autosaver().submit(song, draft_id, immediate=True)
+            st.toast("Saving…")  # written by the background writer; failures show below
             st.rerun()
 
+    # -------- Save status (the background writer reports back here) --------
+    save_status = get_autosaver().status(st.session_state.get("current_draft_id"))
+    if save_status["error"]:
+        st.error(
+            f"Couldn't save this draft: {save_status['error']}. "
+            "Your changes are kept here and saving is retried automatically.",
+            icon="⚠️",
+        )
+    elif save_status["pending"]:
+        st.caption("Saving…")
+
     # -------- Lyrics list box --------
     if not song.lyrics:
         lyrics_text = """<div class="emptyhint">Start writing your song…</div>"""
@@ -1191,33 +1224,10 @@ def render_chat():
 
     # -------- render messages --------
     history = st.session_state.get("chat_history", [])
-    if not history:
-        messages_html = "<div class='emptyhint'>Start a conversation with the AI assistant...</div>"
-    else:
-        parts = []
-        for msg in history:
-            role = msg.get("role", "assistant")
-            cls = "user" if role == "user" else "assistant"
-            raw = msg.get("content", "") or ""
-            safe = html.escape(raw)
-            # תמיכה ב-**bold** => <strong>
-            safe = re.sub(r"\*\*(.+?)\*\*", r"<strong>\1</strong>", safe)
-            safe = re.sub(r"(?m)^\s*\*\s+", "• ", safe)
-            content = safe
-
-            # ✅ keep bold markers readable in plain text bubble (optional)
-            parts.append(f"<div class='msg {cls}'>{content}</div>")
-        messages_html = "".join(parts)
-
-    st.markdown(
-        f"""
-        <div class='panel-box chatbox' style='height:453px;margin-bottom:0px;overflow-y:auto;'>
-          {messages_html}
-          <div id="chat-bottom"></div>
-        </div>
-        """,
-        unsafe_allow_html=True
-    )
+    # placeholder so a streamed reply can be redrawn in place while it arrives
+    chat_box = st.empty()
+    summary = st.session_state.get("chat_summary", "")
+    _draw_chat_box(chat_box, history, summary)
 
     # -------- auto scroll once --------
     should_scroll = st.session_state.get("scroll_chat_to_bottom", False)
@@ -1326,48 +1336,31 @@ def render_chat():
 
             if agent:
                 song = st.session_state.current_song
-                song_snapshot = build_song_snapshot(song)
-                recent_messages = st.session_state.chat_history[-3:]
+                # history is kept short by compaction; older turns live in chat_summary
+                recent_messages = st.session_state.chat_history
 
-                # ===== ✅ NEW: ALWAYS SEND SONG CONTEXT + SHORT-ANSWER RULES =====
                 title = (song.title or "").strip() if song else ""
                 intent = (getattr(song, "intent", "") or "").strip() if song else ""
-                genre = getattr(song, "genre", None) if song else None
-                sub = getattr(song, "sub_genre", None) if song else None
                 mel_desc = (getattr(song, "melody_description", "") or "").strip() if song else ""
                 lyrics_list = (getattr(song, "lyrics", []) or []) if song else []
 
                 lyrics_preview = "\n".join(lyrics_list[-6:]) if lyrics_list else ""
 
-                song_context = (
-                    "SONG CONTEXT (use this to tailor your answer):\n"
-                    f"- Title: {title}\n"
-                    f"- Intent (topic/mood): {intent}\n"
-                )
-
-                if genre or sub:
-                    song_context += f"- Genre/Sub: {genre} / {sub}\n"
-                if mel_desc:
-                    song_context += f"- Melody description (current): {mel_desc[:240]}\n"
-                if lyrics_preview:
-                    song_context += f"- Recent lyrics:\n{lyrics_preview}\n"
-
-                song_context += "\nRULES: 3 bullets max, no paragraphs, end with 1 question.\n\n"
-
                 # ===== 🔎 DYNAMIC GUIDE RULES (keyword-based) =====
                 state = "LYRICS" if st.session_state.current_mode == MODE_LYRICS else "MELODY"
 
                 # נותנים לרטריבר גם הקשר, לא רק ההודעה
-                msg_for_rules = (
-                    f"{text}\n"
+                # the song context rarely changes between sends, so its keyword matches are memoized
+                song_context = (
                     f"{title}\n"
                     f"{intent}\n"
                     f"{mel_desc}\n"
                     f"{lyrics_preview}"
                 )
 
-                picked_rules = retrieve_rules(
-                    message=msg_for_rules,
+                picked_rules = retrieve_rules_incremental(
+                    message=text,
+                    context=song_context,
                     state=state,
                     limit=3
                 )
@@ -1387,16 +1380,31 @@ def render_chat():
                         f"\"{focused_line}\"\n\n"
                     )
 
-                user_payload = song_context + dynamic_rules_block + focused_context + f"USER MESSAGE:\n{text}"
-
-                ai_response = agent.get_response(
-                    user_message=user_payload,
-                    song_snapshot=song_snapshot,
-                    chat_history=recent_messages
+                # ===== ✅ song context (once) + short-answer rules, inside the token budget =====
+                prompt = assemble_prompt(
+                    song,
+                    text,
+                    chat_history=recent_messages,
+                    rules_block=dynamic_rules_block,
+                    focused_context=focused_context,
+                    history_summary=summary,
                 )
+
+                # ===== stream the reply into the chat box as it arrives =====
+                ai_response = ""
+                for chunk in agent.generate_stream(prompt.contents):
+                    ai_response += chunk
+                    _draw_chat_box(
+                        chat_box,
+                        st.session_state.chat_history + [{"role": "assistant", "content": ai_response}],
+                        summary
+                    )
                 ai_response = compact_newlines(ai_response)
 
                 st.session_state.chat_history.append({"role": "assistant", "content": ai_response})
+                st.session_state.chat_summary, st.session_state.chat_history = compact_history(
+                    st.session_state.chat_history, summary
+                )
             else:
                 st.session_state.chat_history.append({
                     "role": "assistant",
@@ -1408,6 +1416,44 @@ def render_chat():
             return
 
 
+def _chat_messages_html(history, summary: str = "") -> str:
+    if not history and not summary:
+        return "<div class='emptyhint'>Start a conversation with the AI assistant...</div>"
+
+    parts = []
+    if summary:
+        parts.append(
+            "<div class='emptyhint'>Earlier in this session:<br>"
+            f"{html.escape(summary).replace(chr(10), '<br>')}</div>"
+        )
+    for msg in history:
+        role = msg.get("role", "assistant")
+        cls = "user" if role == "user" else "assistant"
+        raw = msg.get("content", "") or ""
+        safe = html.escape(raw)
+        # תמיכה ב-**bold** => <strong>
+        safe = re.sub(r"\*\*(.+?)\*\*", r"<strong>\1</strong>", safe)
+        safe = re.sub(r"(?m)^\s*\*\s+", "• ", safe)
+        content = safe
+
+        # ✅ keep bold markers readable in plain text bubble (optional)
+        parts.append(f"<div class='msg {cls}'>{content}</div>")
+    return "".join(parts)
+
+
+def _draw_chat_box(placeholder, history, summary: str = ""):
+    """(Re)draw the chat bubbles inside a st.empty() placeholder."""
+    placeholder.markdown(
+        f"""
+        <div class='panel-box chatbox' style='height:453px;margin-bottom:0px;overflow-y:auto;'>
+          {_chat_messages_html(history, summary)}
+          <div id="chat-bottom"></div>
+        </div>
+        """,
+        unsafe_allow_html=True
+    )
+
+
 def compact_newlines(text: str) -> str:
     if not text:
         return ""
@@ -1435,10 +1481,12 @@ def render_sidebar_drafts():
         """, unsafe_allow_html=True)
 
         if st.button("+ Start a new song", use_container_width=True, key="create_new_song"):
+            autosave_current_song(immediate=True)
             st.session_state.show_creation_modal = True
             st.session_state.current_song = None
             st.session_state.current_draft_id = None  # ✅ הכי חשוב
             st.session_state.chat_history = []
+            st.session_state.chat_summary = ""
 
             # ✅ reset one-time hints for the new song/session
             st.session_state.mode_greeted_once = False
@@ -1452,15 +1500,93 @@ def render_sidebar_drafts():
         st.markdown("---")
         st.markdown("<div style='height:20px'></div>", unsafe_allow_html=True)
 
-        drafts = load_drafts()
+        # only one page of drafts is rendered; search/paging go through the in-process index
+        query = st.text_input("Search drafts", key="drafts_query", placeholder="Search drafts…",
+                              label_visibility="collapsed")
+        if st.session_state.get("drafts_query_seen") != query:
+            st.session_state.drafts_query_seen = query
+            st.session_state.drafts_page = 0
+        page = st.session_state.get("drafts_page", 0)
+
+        total, drafts = search_drafts(query, offset=page * DRAFTS_SIDEBAR_PAGE_SIZE, limit=DRAFTS_SIDEBAR_PAGE_SIZE)
+        pages = max(1, -(-total // DRAFTS_SIDEBAR_PAGE_SIZE))
+        if page >= pages:
+            page = st.session_state.drafts_page = pages - 1
+            total, drafts = search_drafts(query, offset=page * DRAFTS_SIDEBAR_PAGE_SIZE,
+                                          limit=DRAFTS_SIDEBAR_PAGE_SIZE)
+        if query and not total:
+            st.caption("No drafts match.")
+
         for d in drafts:
             if st.button(d["name"], key=f"draft_{d['id']}", use_container_width=True):
-                st.session_state.current_song = dict_to_song(d["song"])
+                autosave_current_song(immediate=True)
+                # a save of this draft may still be queued: open that version, not the stored one
+                song = get_autosaver().latest(d["id"])
+                if song is None:
+                    stored = get_draft(d["id"])
+                    if stored is None:
+                        st.warning("This draft no longer exists.")
+                        st.stop()
+                    song = dict_to_song(stored["song"])
+                st.session_state.current_song = song
                 st.session_state.current_draft_id = d["id"]
                 st.session_state.chat_history = []
+                st.session_state.chat_summary = ""
                 st.session_state.mode_greeted_once = False
                 st.switch_page("pages/2_Workspace.py")
 
+        if pages > 1:
+            prev_col, label_col, next_col = st.columns([1, 1.4, 1])
+            with prev_col:
+                if st.button("‹", key="drafts_prev", disabled=page == 0, use_container_width=True):
+                    st.session_state.drafts_page = page - 1
+                    st.rerun()
+            with label_col:
+                st.caption(f"{page + 1} / {pages} · {total} drafts")
+            with next_col:
+                if st.button("›", key="drafts_next", disabled=page >= pages - 1, use_container_width=True):
+                    st.session_state.drafts_page = page + 1
+                    st.rerun()
+
+        render_draft_history()
+
+
+def _diff_text(diff) -> str:
+    out = []
+    for name, (old, new) in diff["fields"].items():
+        out.append(f"{name}: {old!r} -> {new!r}")
+    for change in diff["lyrics"]:
+        out.append(f"@@ line {change['old_start'] + 1}")
+        out.extend(f"- {line}" for line in change["old"])
+        out.extend(f"+ {line}" for line in change["new"])
+    return "\n".join(out) or "(no changes)"
+
+
+def render_draft_history():
+    """Saved versions of the open draft: pick one, see what changed since, restore it."""
+    draft_id = st.session_state.get("current_draft_id")
+    song = st.session_state.get("current_song")
+    if not DRAFTS_HISTORY_ENABLED or not draft_id or song is None:
+        return
+    versions = list_draft_versions(draft_id)
+    if len(versions) < 2:
+        return
+
+    with st.expander("🕘 Version history"):
+        labels = {v["version_no"]: f"v{v['version_no']} · {v['created_at']} · {v['lines']} lines" for v in versions}
+        chosen = st.selectbox("Version", list(labels)[1:], format_func=labels.get, key="history_version")
+        diff = diff_draft_versions(draft_id, chosen, versions[0]["version_no"])
+        if diff is not None:
+            st.caption(f"Changes from v{chosen} to the latest version:")
+            st.code(_diff_text(diff), language="diff")
+        if st.button("Restore this version", key="history_restore", use_container_width=True):
+            restored = restore_draft_version(draft_id, chosen, current=song)
+            if restored is not None:
+                st.session_state.current_song = restored
+                get_autosaver().submit(restored, draft_id, immediate=True)
+                st.toast(f"Restored v{chosen}")
+                st.rerun()
+
 
 def _push_welcome_message():
     _chat_add("assistant",
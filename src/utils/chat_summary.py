@@ -0,0 +1,56 @@
+"""
+Rolling chat-history compaction for ECHO.
+Older turns are folded into a short local (no LLM call) summary so the
+prompt and st.session_state.chat_history stay the same size however long
+the songwriting session runs.
+"""
+
+import re
+from typing import Dict, List, Tuple
+
+from src.config.settings import (
+    CHAT_COMPACT_MAX_TURNS, CHAT_COMPACT_MAX_TOKENS, CHAT_KEEP_RECENT_TURNS, CHAT_SUMMARY_MAX_LINES
+)
+from src.utils.prompt_builder import estimate_tokens
+
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s")
+
+
+def _gist(text: str, max_chars: int = 140) -> str:
+    """First sentence (or line) of a message, shortened."""
+    text = re.sub(r"\*\*(.+?)\*\*", r"\1", text or "")  # drop **bold** markers
+    first = _SENTENCE_END_RE.split(" ".join(text.split()), maxsplit=1)[0]
+    return first if len(first) <= max_chars else first[:max_chars - 1].rstrip() + "…"
+
+
+def summarize_turns(turns: List[Dict], previous_summary: str = "", max_lines: int = CHAT_SUMMARY_MAX_LINES) -> str:
+    """
+    Fold turns into the rolling summary: one line per turn, newest last.
+    Only the last `max_lines` lines are kept, so the summary never grows past that.
+    """
+    lines = [l for l in (previous_summary or "").splitlines() if l.strip()]
+    for msg in turns:
+        gist = _gist(msg.get("content", ""))
+        if not gist:
+            continue
+        who = "User" if msg.get("role") == "user" else "Coach"
+        lines.append(f"- {who}: {gist}")
+    return "\n".join(lines[-max_lines:])
+
+
+def needs_compaction(history: List[Dict]) -> bool:
+    if len(history) > CHAT_COMPACT_MAX_TURNS:
+        return True
+    return sum(estimate_tokens(m.get("content", "")) for m in history) > CHAT_COMPACT_MAX_TOKENS
+
+
+def compact_history(history: List[Dict], summary: str = "",
+                    keep_last: int = CHAT_KEEP_RECENT_TURNS) -> Tuple[str, List[Dict]]:
+    """
+    If history crossed the turn/token threshold, fold everything but the last
+    `keep_last` turns into the summary. Returns (summary, remaining_history).
+    """
+    if not needs_compaction(history) or len(history) <= keep_last:
+        return summary, history
+    old, recent = history[:-keep_last], history[-keep_last:]
+    return summarize_turns(old, summary), recent
@@ -0,0 +1,133 @@
+"""
+Prompt assembly for ECHO chat turns.
+Builds the Gemini `contents` once per turn (song context sent a single time)
+and keeps the prompt inside an input-token budget.
+"""
+
+from dataclasses import dataclass
+from typing import List, Dict, Optional
+
+from src.config.settings import PROMPT_TOKEN_BUDGET
+
+SHORT_ANSWER_RULES = "RULES: 3 bullets max, no paragraphs, end with 1 question."
+
+
+@dataclass
+class AssembledPrompt:
+    contents: List[Dict]
+    token_count: int
+    dropped_history: int = 0
+    dropped_lyrics: int = 0
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 chars per token for English text; good enough for budgeting (no API call)
+    return (len(text or "") + 3) // 4
+
+
+def _song_context(song, lyrics: List[str], first_line_no: int) -> str:
+    if not song:
+        return "SONG CONTEXT:\nNo song yet.\n"
+
+    title = (song.title or "").strip()
+    intent = (getattr(song, "intent", "") or "").strip()
+    genre = getattr(song, "genre", None)
+    sub = getattr(song, "sub_genre", None)
+    mel_desc = (getattr(song, "melody_description", "") or "").strip()
+
+    lines = [
+        "SONG CONTEXT (use this to tailor your answer):",
+        f"- Title: {title}",
+        f"- Intent (topic/mood): {intent}",
+    ]
+    if genre or sub:
+        lines.append(f"- Genre/Sub: {genre} / {sub}")
+    lines.append(f"- Melody description (current): {mel_desc or 'Not set'}")
+
+    lines.append("- Lyrics (current version):")
+    if lyrics:
+        if first_line_no > 1:
+            lines.append(f"  (lines 1-{first_line_no - 1} omitted)")
+        for i, line in enumerate(lyrics, first_line_no):
+            lines.append(f"{i}. {line}")
+    else:
+        lines.append("— No lyrics yet —")
+
+    return "\n".join(lines) + "\n"
+
+
+def _history_contents(chat_history: List[Dict], user_text: str) -> List[Dict]:
+    history = list(chat_history or [])
+    # the current message is sent separately -> don't send it twice
+    if history and history[-1].get("role") == "user" and history[-1].get("content") == user_text:
+        history = history[:-1]
+
+    return [
+        {
+            "role": "model" if msg.get("role") == "assistant" else "user",
+            "parts": [{"text": msg.get("content", "")}],
+        }
+        for msg in history
+    ]
+
+
+def _count(contents: List[Dict]) -> int:
+    return sum(estimate_tokens(p.get("text", "")) for c in contents for p in c["parts"])
+
+
+def assemble_prompt(
+        song,
+        user_text: str,
+        chat_history: Optional[List[Dict]] = None,
+        rules_block: str = "",
+        focused_context: str = "",
+        history_summary: str = "",
+        max_tokens: int = PROMPT_TOKEN_BUDGET,
+) -> AssembledPrompt:
+    """
+    Build the contents for one chat turn:
+    history turns (oldest first), then one user message with song context +
+    summary of older turns + short-answer rules + guide rules + focused line + the message.
+
+    Over budget -> drop the oldest history turns first, then the oldest lyric lines.
+    """
+    history = _history_contents(chat_history, user_text)
+    lyrics = list((getattr(song, "lyrics", []) or []) if song else [])
+    first_line_no = 1
+    dropped_history = 0
+    dropped_lyrics = 0
+    summary_block = f"\nEARLIER IN THIS CONVERSATION (summary):\n{history_summary}\n" if history_summary else ""
+
+    def build() -> List[Dict]:
+        payload = (
+            _song_context(song, lyrics, first_line_no)
+            + summary_block
+            + f"\n{SHORT_ANSWER_RULES}\n\n"
+            + (rules_block or "")
+            + (focused_context or "")
+            + f"USER MESSAGE:\n{user_text}"
+        )
+        return history + [{"role": "user", "parts": [{"text": payload}]}]
+
+    contents = build()
+    tokens = _count(contents)
+
+    # trim using per-item estimates, then rebuild once and re-check exactly
+    while tokens > max_tokens and (history or lyrics):
+        while tokens > max_tokens and history:
+            tokens -= _count([history.pop(0)])
+            dropped_history += 1
+        while tokens > max_tokens and lyrics:
+            tokens -= estimate_tokens(f"{first_line_no}. {lyrics.pop(0)}\n")
+            first_line_no += 1
+            dropped_lyrics += 1
+
+        contents = build()
+        tokens = _count(contents)
+
+    return AssembledPrompt(
+        contents=contents,
+        token_count=tokens,
+        dropped_history=dropped_history,
+        dropped_lyrics=dropped_lyrics,
+    )